@@ -1,10 +1,18 @@
 # ipc_publisher.py
+import os
+import sys
 import socket
 import time
 import json
 import random
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# telemetry_batch / telemetry_codec (and with them numpy) are imported only when BATCH or binary ENCODING needs them
+
 SERVER_ADDRESS = ("localhost", 9999)
+BATCH = False  # True: many samples per message (limits in telemetry_batch.py); needs batch-aware subscribers
+SAMPLE_HZ = 10 if BATCH else 1  # unbatched keeps the old one message a second
+ENCODING = "json"  # newline-delimited JSON; "binary": struct format of telemetry_codec.py for subscribers that decode it
 
 def connect_to_subscriber():
     while True:
@@ -20,30 +28,51 @@ def connect_to_subscriber():
 def simulate_data():
     sock = connect_to_subscriber()
 
+    def send(message):
+        nonlocal sock
+        try:
+            # Binary messages carry their own length; JSON is newline-delimited
+            sock.sendall(message if isinstance(message, bytes) else (message + "\n").encode())
+            return True
+        except (BrokenPipeError, ConnectionResetError):
+            print("Connection lost. Reconnecting...")
+            sock.close()
+            sock = connect_to_subscriber()
+            return False
+
+    def send_batch(message):
+        if send(message):
+            print(f" Published batch: {len(message)} bytes")
+
+    batcher = None
+    if BATCH:
+        from telemetry_batch import TelemetryBatcher
+        batcher = TelemetryBatcher(send_batch, encoding=ENCODING)
+    encode = json.dumps
+    if ENCODING == "binary":
+        from telemetry_codec import encode_sample as encode
+
     while True:
         lat = 12.97 + random.uniform(-0.01, 0.01)
         lon = 77.59 + random.uniform(-0.01, 0.01)
         speed = random.uniform(30, 80)
 
-        if random.random() < 0.05:
+        if random.random() < 0.05 / SAMPLE_HZ:
             speed = random.uniform(130, 160)
 
         payload = {
+            "timestamp": time.time(),
             "latitude": lat,
             "longitude": lon,
             "speed": speed
         }
 
-        message = json.dumps(payload) + "\n"
-        try:
-            sock.sendall(message.encode())
+        if batcher:
+            batcher.add(payload)
+        elif send(encode(payload)):
             print(" Published:", payload)
-        except (BrokenPipeError, ConnectionResetError):
-            print("Connection lost. Reconnecting...")
-            sock.close()
-            sock = connect_to_subscriber()
 
-        time.sleep(1)
+        time.sleep(1 / SAMPLE_HZ)
 
 if __name__ == "__main__":
     simulate_data()
@@ -1,63 +1,75 @@
 # ipc_subscriber.py
 import cv2
 import os
+import sys
 import time
-import json
 import socket
 import datetime
 import threading
-from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from frame_ring import FrameRing
+from incident_writer import IncidentWriter
+from preview import make_preview
+from loop_recorder import SegmentedLoopRecorder
+from camera_discovery import find_camera
+from detectors import TriggerBus, DetectorPipeline, SpeedDetector, KinematicsDetector
+from geofence import GeofenceIndex
+from telemetry_batch import newest_sample
+from telemetry_codec import decode, split_messages
 
 SERVER_ADDRESS = ("localhost", 9999)
 INCIDENT_SPEED_THRESHOLD = 120
+SPEED_ZONES_FILE = None  # GeoJSON/CSV of per-zone speed limits, see geofence.py
 PRE_SECONDS = 20
 POST_SECONDS = 20
 FPS = 20
 RESOLUTION = (640, 480)
 LOOP_DURATION_MINUTES = 20
+LOOP_SEGMENT_SECONDS = 10
 SILENCE_TIMEOUT = 30
+USE_KINEMATICS = False  # harsh braking / crash / GPS mismatch; needs real 10 Hz+ telemetry
 
 incident_triggered = False
 incident_clear = False
 last_data = {}
 last_message_time = time.time()
+trigger_bus = TriggerBus()
+speed_zones = GeofenceIndex.load(SPEED_ZONES_FILE, INCIDENT_SPEED_THRESHOLD) if SPEED_ZONES_FILE else None
+detectors = DetectorPipeline(trigger_bus, telemetry_detectors=[SpeedDetector(INCIDENT_SPEED_THRESHOLD, speed_zones)] +
+                                                               ([KinematicsDetector()] if USE_KINEMATICS else []))
+
+def on_trigger(source, active, detail, active_sources):
+    global incident_triggered, incident_clear
+    if active:
+        if not incident_triggered:
+            print(f"\n {detail} — incident started.")
+        incident_triggered = True
+        incident_clear = False
+    elif not active_sources and incident_triggered and not incident_clear:
+        print(f"\n {detail} — starting post-incident buffer.")
+        incident_clear = True
+
+trigger_bus.subscribe(on_trigger)
 
 def get_timestamp():
     return datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-def save_incident_clip(pre_frames, post_frames):
+def open_incident_clip(incident_writer, pre_buffer):
+    # Clip is opened at trigger time: pre-roll written first, post frames streamed after it.
     os.makedirs("./incidents", exist_ok=True)
     filename = f"incident_{get_timestamp()}.mp4"
     filepath = os.path.join("./incidents", filename)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(filepath, fourcc, FPS, RESOLUTION)
-
-    for f in pre_frames + post_frames:
-        out.write(f)
-
-    out.release()
-    print(f"\n Incident saved: {filepath}")
-
-def save_loop_clip(writer):                                        #Saves the current continuous recording loop.
-    writer.release()                                               #Finalizes the current video file.
-    timestamp = get_timestamp()                                    #Gets a timestamp for naming the saved loop.
-    final_path = f"./continuous/continuous_{timestamp}.mp4"              #Constructs a full path for the final loop file.
-    os.makedirs("./continuous", exist_ok=True)                     #Ensures the output folder exists.
-    os.rename("./Continuos_record.mp4", final_path)                     #Renames the in-progress file to a timestamped name.
-    print(f" Continuous loop saved: {final_path}")
+    return incident_writer.open_clip(filepath, RESOLUTION, FPS, pre_buffer.detach, pool_size=int(2 * FPS))
 
 def find_working_camera(max_index=5):
-    for i in range(max_index):
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            cap.release()
-            print(f"📷 Using camera index: {i}")
-            return i
-        cap.release()
-    return None
+    i = find_camera(RESOLUTION, FPS, max_index=max_index)
+    if i is not None:
+        print(f"📷 Using camera index: {i}")
+    return i
 
 def socket_listener():
-    global incident_triggered, incident_clear, last_data, last_message_time
+    global last_data, last_message_time
 
     server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_sock.bind(SERVER_ADDRESS)
@@ -67,37 +79,30 @@ def socket_listener():
     conn, addr = server_sock.accept()
     print(f"Connected by {addr}")
 
-    buffer = ""
+    buffer = b""
     try:
         while True:
-            data = conn.recv(1024).decode()
+            data = conn.recv(65536)  # a batch is several KB
             if not data:
                 print(" Publisher disconnected.")
                 break
 
             buffer += data
-            while '\n' in buffer:
-                line, buffer = buffer.split('\n', 1)
-                if not line.strip():
-                    continue
+            messages, buffer = split_messages(buffer)  # JSON lines and binary messages, see telemetry_codec.py
+            for raw in messages:
                 try:
-                    payload = json.loads(line)
-                    speed = payload.get("speed", 0)
-                    last_data = payload
+                    payload, batch = decode(raw)
                     last_message_time = time.time()
+                    if batch is not None:
+                        last_data = newest_sample(batch)
+                        print(f" Received batch of {len(batch['speed'])} samples, latest:", last_data)
+                        detectors.offer_batch(batch)
+                        continue
+                    last_data = payload
                     print(" Received:", payload)
-
-                    if speed > INCIDENT_SPEED_THRESHOLD:
-                        if not incident_triggered:
-                            print(f"\n High speed: {speed:.2f} km/h — incident started.")
-                        incident_triggered = True
-                        incident_clear = False
-                    else:
-                        if incident_triggered and not incident_clear:
-                            print(f"\n Speed normalized ({speed:.2f} km/h) — starting post-incident buffer.")
-                            incident_clear = True
+                    detectors.offer_message(payload)
                 except Exception as e:
-                    print("Error decoding JSON:", e)
+                    print("Error decoding telemetry:", e)
     finally:
         conn.close()
         server_sock.close()
@@ -109,6 +114,8 @@ def silence_watchdog():
         if time.time() - last_message_time > SILENCE_TIMEOUT and incident_triggered:
             print("\n No data in 30s — treating as post-incident.")
             incident_clear = True
+            for detector in detectors.telemetry_detectors:
+                trigger_bus.forget(detector.name)
 
 def monitor():
     global incident_triggered, incident_clear
@@ -122,56 +129,63 @@ def monitor():
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, RESOLUTION[1])
     cap.set(cv2.CAP_PROP_FPS, FPS)
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    loop_writer = cv2.VideoWriter("loop_record.mp4", fourcc, FPS, RESOLUTION)
-    loop_start_time = time.time()
-    max_loop_duration = LOOP_DURATION_MINUTES * 60
+    loop_writer = SegmentedLoopRecorder("./continuous", RESOLUTION, FPS, LOOP_SEGMENT_SECONDS,
+                                        LOOP_DURATION_MINUTES * 60, prefix="continuous")
 
-    pre_buffer = deque(maxlen=int(PRE_SECONDS * FPS))
-    post_frames = []
+    pre_buffer = FrameRing(int(PRE_SECONDS * FPS), RESOLUTION)
+    incident_writer = IncidentWriter(workers=1, max_pending=2)
+    clip = None
+    incident_open = False
     post_timer_started = False
     post_timer_start = None
 
+    preview = make_preview("Live", stop_key='q')
     print("Recording started...")
 
     try:
         while True:
-            ret, frame = cap.read()
+            ret, frame = pre_buffer.read(cap)
             if not ret:
                 print("Frame read failed.")
                 break
 
             loop_writer.write(frame)
-            pre_buffer.append(frame)
-
-            if time.time() - loop_start_time >= max_loop_duration:
-                save_loop_clip(loop_writer)
-                loop_writer = cv2.VideoWriter("loop_record.mp4", fourcc, FPS, RESOLUTION)
-                loop_start_time = time.time()
-                print("Overwriting continuous loop recording...")
 
-            cv2.imshow("Live", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+            if preview:
+                preview.offer(frame)
+                if preview.stop_requested:
+                    break
 
             if incident_triggered:
-                post_frames.append(frame)
+                if not incident_open:
+                    clip = open_incident_clip(incident_writer, pre_buffer)  # pre-roll ends with this frame
+                    incident_open = True
+                elif clip:
+                    clip.append(frame)
 
                 if incident_clear:
                     if not post_timer_started:
                         post_timer_start = time.time()
                         post_timer_started = True
                     elif time.time() - post_timer_start >= POST_SECONDS:
-                        print("Saving incident...")
-                        save_incident_clip(list(pre_buffer), post_frames)
+                        print("Closing incident clip...")
+                        if clip:
+                            clip.close()
+                        print(f"Incident writer: {incident_writer.queue_depth()} pending")
                         incident_triggered = False
                         incident_clear = False
                         post_timer_started = False
-                        post_frames.clear()
+                        incident_open = False
+                        clip = None
     finally:
         cap.release()
-        loop_writer.release()
-        cv2.destroyAllWindows()
+        loop_writer.close()
+        if clip:
+            clip.close()
+        incident_writer.close()
+        print(f" Incident writer: {incident_writer.stats()}")
+        if preview:
+            preview.close()
         print(" Camera and writer cleaned up.")
 
 if __name__ == "__main__":
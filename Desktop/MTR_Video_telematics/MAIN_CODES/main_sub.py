@@ -6,6 +6,10 @@ import paho.mqtt.client as mqtt
 from collections import deque                                     # Stores a fixed size buffer of frames before the incident(Used for a fixed-length video buffer) 
 import datetime
 import threading                                                  #For running background tasks like the MQTT silence watchdog without blocking the camera loop.
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from telemetry_codec import is_binary, read_speed                 #Binary telemetry (see telemetry_codec.py) next to JSON.
+from preview import make_preview                                  #Decimated preview off the capture loop; None when headless.
 
 # === CONFIG ===
 #Defining parameters    
@@ -72,9 +76,17 @@ def on_message(client, userdata, msg):                            #Called when a
     try:
         if not msg.payload:
             return                                                #Skip if message is empty.
-        payload = json.loads(msg.payload.decode())                #Decodes the JSON data.
-        speed = payload.get("speed", 0)
-        last_data = payload                                       #Extracts the speed and stores the entire payload.
+        if is_binary(msg.payload):
+            speed = read_speed(msg.payload)                       #Binary message: reads just the speed (fastest of a batch), no dict.
+        else:
+            payload = json.loads(msg.payload.decode())            #Decodes the JSON data.
+            if "batch" in payload:                                #Batched publisher: many samples in one message.
+                speeds = payload["batch"].get("speed") or [0]
+                speed = max(speeds)                               #Fastest sample of the batch decides.
+                payload = {field: values[-1] for field, values in payload["batch"].items() if values}
+            else:
+                speed = payload.get("speed", 0)
+            last_data = payload                                   #Extracts the speed and stores the entire payload.
 
         if speed > INCIDENT_SPEED_THRESHOLD:
             if not incident_triggered:
@@ -85,8 +97,8 @@ def on_message(client, userdata, msg):                            #Called when a
             if incident_triggered and not incident_clear:
                 print(f"\n Speed normalized ({speed:.2f} km/h) — starting post-incident buffer...")
                 incident_clear = True
-    except json.JSONDecodeError:
-        print("Invalid JSON payload")
+    except ValueError:                                            #Bad JSON or an unknown binary version.
+        print("Invalid telemetry payload")
     except Exception as e:
         print(" MQTT error:", e)
 
@@ -131,6 +143,7 @@ def monitor():
     post_frames = []
     post_timer_started = False
     post_timer_start = None
+    preview = make_preview("Live Recording")
 
     print("Camera recording started with incident monitoring via MQTT...")
 
@@ -150,9 +163,10 @@ def monitor():
                 loop_start_time = time.time()
                 print(" Overwriting continuous loop recording...")
 
-            cv2.imshow("Live Recording", frame)
-            if cv2.waitKey(1) & 0xFF == ord('s'):
-                break
+            if preview:
+                preview.offer(frame)
+                if preview.stop_requested:
+                    break
 
             if incident_triggered:
                 post_frames.append(frame)
@@ -176,7 +190,8 @@ def monitor():
     finally:
         cap.release()
         save_loop_clip(loop_writer)
-        cv2.destroyAllWindows()
+        if preview:
+            preview.close()
         print(" Cleaned up camera and writer.")
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 # ipc_subscriber.py
 import cv2               # OpenCV for video capture and writing
 import os                # For file and directory handling
+import sys               # For importing the shared modules two levels up
 import time              # For time-based operations
 import json              # For decoding JSON data
 import socket            # For TCP communication with publisher
@@ -8,6 +9,9 @@ import datetime          # For timestamping filenames
 import threading         # For running socket listener and watchdog in parallel
 from collections import deque  # For buffering pre-incident frames
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from preview import make_preview  # Decimated live view off the capture loop; None when headless
+
 # Settings
 SERVER_ADDRESS = ("localhost", 9999)          # Subscriber will listen on this address and port
 INCIDENT_SPEED_THRESHOLD = 120                # Speed (km/h) above which an "incident" is triggered
@@ -74,17 +78,17 @@ def socket_listener():
     conn, addr = server_sock.accept()
     print(f"Connected by {addr}")
 
-    buffer = ""
+    buffer = b""
     try:
         while True:
-            data = conn.recv(1024).decode()
+            data = conn.recv(1024)  # bytes: an undecodable line fails in json.loads below, not here
             if not data:
                 print(" Publisher disconnected.")
                 break
 
             buffer += data
-            while '\n' in buffer:
-                line, buffer = buffer.split('\n', 1)
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
                 if not line.strip():
                     continue
                 try:
@@ -144,6 +148,7 @@ def monitor():
     post_timer_started = False
     post_timer_start = None
 
+    preview = make_preview("Live", stop_key='q')  # PREVIEW=off or no DISPLAY: no GUI calls at all
     print("Recording started...")
 
     try:
@@ -163,10 +168,11 @@ def monitor():
                 loop_start_time = time.time()
                 print("Overwriting continuous loop recording...")
 
-            # Display the live camera feed
-            cv2.imshow("Live", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+            # Display the live camera feed (reduced rate and size, shown by the preview)
+            if preview:
+                preview.offer(frame)
+                if preview.stop_requested:
+                    break
 
             # Incident is active
             if incident_triggered:
@@ -188,7 +194,8 @@ def monitor():
     finally:
         cap.release()
         loop_writer.release()
-        cv2.destroyAllWindows()
+        if preview:
+            preview.close()
         print(" Camera and writer cleaned up.")
 
 # Start the socket listener and watchdog in background threads, and run the main monitor loop
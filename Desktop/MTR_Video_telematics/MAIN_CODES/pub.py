@@ -1,15 +1,34 @@
 # simulator.py
+import os
+import sys
 import time
 import random
 import json
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+#telemetry_batch / telemetry_codec (and with them numpy) are imported only when BATCH or binary ENCODING needs them
+
 broker = "localhost"
 topic = "vehicle/data" #Data is published to this topic 
+BATCH = False #True packs many samples into one message (limits in telemetry_batch.py); only for batch-aware subscribers
+SAMPLE_HZ = 10 if BATCH else 1 #Samples per second, like a CAN/GPS feed (10-100 Hz) when batched; one message a second otherwise
+ENCODING = "json" #"binary" sends the struct format of telemetry_codec.py (28 bytes a sample); only for subscribers that decode it
 client = mqtt.Client() #Creating MQTT client 
 client.connect(broker, 1883, 60) #Connecting to the broker onport 1883 with a 60 second keep-alive timeout 
 
+def publish_batch(payload):
+    client.publish(topic, payload) #One message carries every sample since the last batch
+    print(f"Published batch: {len(payload)} bytes")
+
 def simulate_data():
+    batcher = None
+    if BATCH:
+        from telemetry_batch import TelemetryBatcher
+        batcher = TelemetryBatcher(publish_batch, encoding=ENCODING)
+    encode = json.dumps
+    if ENCODING == "binary":
+        from telemetry_codec import encode_sample as encode
     while True: #Starting a loop to continuously generate and publish data 
         # Normal data
         #Generating  mock GPS coordinates(lat,long) and speed between 30-80km/h
@@ -18,21 +37,27 @@ def simulate_data():
         speed = random.uniform(30, 80)
 
         # Inject random incident
-        if random.random() < 0.05:  # 5% chance
+        if random.random() < 0.05 / SAMPLE_HZ:  # ~5% of seconds
             speed = random.uniform(130, 160)  # high-speed incident
         
-        #Encoding the telemetry as a JSON string.
-        payload = json.dumps({
+        sample = {
+            "timestamp": time.time(),
             "latitude": lat,
             "longitude": lon,
             "speed": speed
-        })
+        }
+
+        if batcher:
+            batcher.add(sample) #Sent once the batch is full or its oldest sample is due
+        else:
+            #Encoding the telemetry as binary or as a JSON string.
+            payload = encode(sample)
 
-        #Publishes the data to the MQTT topic and printing msg to the console 
-        client.publish(topic, payload)
-        print("Published:", payload)
-        #waiting 1 sec before the next message 
-        time.sleep(1)
+            #Publishes the data to the MQTT topic and printing msg to the console 
+            client.publish(topic, payload)
+            print("Published:", sample)
+        #waiting one sample period before the next sample 
+        time.sleep(1 / SAMPLE_HZ)
 
 if __name__ == "__main__":
     simulate_data()
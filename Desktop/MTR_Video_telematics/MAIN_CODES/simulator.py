@@ -3,10 +3,17 @@ import time
 import math
 import cv2
 import os
+import sys
 from collections import deque
 import datetime
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from compressed_buffer import JpegFrameBuffer, EncodedFrameBuffer
+from preview import make_preview
+from video_writer import open_video_writer
+from camera_broker import BrokerCapture
+
 # Simulated Vehicle Publisher Code (Publisher)
 class SimulatedVehicle:
     def __init__(self, x=0, y=0, velocity=0):
@@ -52,8 +59,7 @@ def save_incident_clip(pre_frames, post_frames, resolution, fps=20.0):
     os.makedirs(save_dir, exist_ok=True)
     filename = f"incident_{get_timestamp()}.mp4"
     filepath = os.path.join(save_dir, filename)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(filepath, fourcc, fps, resolution)
+    out = open_video_writer(filepath, fps, resolution)
 
     for frame in pre_frames:
         out.write(frame)
@@ -67,13 +73,30 @@ def save_incident_clip(pre_frames, post_frames, resolution, fps=20.0):
 
 # Subscriber (video capture & incident handler)
 class Subscriber:
-    def __init__(self, camera_index=1, resolution=(640, 480), fps=20.0):
+    def __init__(self, camera_index=1, resolution=(640, 480), fps=20.0,
+                 buffer_mode="jpeg", jpeg_quality=80, buffer_budget_mb=48, use_broker=False):
         self.camera_index = camera_index
+        self.use_broker = use_broker
         self.resolution = resolution
         self.fps = fps
         self.buffer_time = 3 * 60  # 3 minutes buffer
-        self.frame_buffer = deque(maxlen=int(self.buffer_time * fps))
-        self.cap = cv2.VideoCapture(self.camera_index)
+        self.buffer_mode = buffer_mode
+        # 3 min of raw 640x480 is ~3.3 GB; "jpeg" keeps it within the budget by
+        # lowering quality, "h264" (needs ffmpeg) encodes it once into a few MB of GOPs
+        if buffer_mode == "jpeg":
+            self.frame_buffer = JpegFrameBuffer(int(self.buffer_time * fps), quality=jpeg_quality,
+                                                max_bytes=buffer_budget_mb * 1024 * 1024)
+        elif buffer_mode == "h264":
+            self.frame_buffer = EncodedFrameBuffer(self.buffer_time, resolution, fps,
+                                                   max_bytes=buffer_budget_mb * 1024 * 1024)
+        else:
+            self.frame_buffer = deque(maxlen=int(self.buffer_time * fps))
+        if use_broker:
+            # Every reader gets its own cursor on camera_broker.py's frame bus: the
+            # recording loop and the post-incident capture both see every frame.
+            self.cap = BrokerCapture(fps=fps, resolution=resolution)
+        else:
+            self.cap = cv2.VideoCapture(self.camera_index)
         self.lock = threading.Lock()
 
         if not self.cap.isOpened():
@@ -87,7 +110,10 @@ class Subscriber:
 
         try:
             print(f"🚨 Incident occurred at Location: ({x}, {y}), Speed: {speed} m/s")
-            pre_frames = list(self.frame_buffer)
+            if self.buffer_mode in ("jpeg", "h264"):
+                pre_frames = self.frame_buffer.frames()  # decoded lazily while the clip is written
+            else:
+                pre_frames = list(self.frame_buffer)
             post_frames = self.capture_post_incident()
             save_incident_clip(pre_frames, post_frames, self.resolution, self.fps)
         except Exception as e:
@@ -95,6 +121,18 @@ class Subscriber:
 
     def capture_post_incident(self):
         post_frames = []
+        if self.use_broker:
+            reader = BrokerCapture(fps=self.fps, resolution=self.resolution)
+            start_time = time.time()
+            while time.time() - start_time < 15:  # 15 seconds after incident
+                ret, frame = reader.read()
+                if not ret:
+                    print("❌ Failed to capture post-incident frame.")
+                    break
+                post_frames.append(frame)  # recording loop keeps filling frame_buffer itself
+            reader.release()
+            return post_frames
+
         start_time = time.time()
         while time.time() - start_time < 15:  # 15 seconds after incident
             with self.lock:
@@ -105,12 +143,13 @@ class Subscriber:
             self.frame_buffer.append(frame)
             post_frames.append(frame)
         return post_frames
+
     def start_recording(self):
         if self.cap is None:
             return
 
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        video_writer = cv2.VideoWriter("continuous_video1.mp4", fourcc, self.fps, self.resolution)
+        video_writer = open_video_writer("continuous_video1.mp4", self.fps, self.resolution)
+        preview = make_preview("Continuous Video Feed", stop_key='q')
 
         while True:
             with self.lock:
@@ -122,13 +161,17 @@ class Subscriber:
             self.frame_buffer.append(frame)
             video_writer.write(frame)
 
-            cv2.imshow("Continuous Video Feed", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+            if preview:
+                preview.offer(frame)
+                if preview.stop_requested:
+                    break
 
         self.cap.release()
         video_writer.release()
-        cv2.destroyAllWindows()
+        if self.buffer_mode == "h264":
+            self.frame_buffer.close()
+        if preview:
+            preview.close()
 
 
 # Main function
@@ -0,0 +1,66 @@
+# brightness.py
+import cv2
+import numpy as np
+
+from capture import decode_packet
+
+LOW_LIGHT_THRESHOLD = 50  # mean 0-255 luma below which visibility counts as low
+# cv2.COLOR_BGR2GRAY weights (BT.601). The mean of a weighted sum is the
+# weighted sum of the channel means, so no gray image is ever built.
+GRAY_WEIGHTS = (0.114, 0.587, 0.299)
+
+
+# Low-visibility meter replacing cvtColor(frame, BGR2GRAY).mean() per frame.
+# Measures every `every`-th frame on a strided subsample of an optional ROI:
+# a nearest-neighbour resize picks exactly frame[::stride, ::stride] into a
+# preallocated thumbnail (stride 4 reads 1/16 of the pixels), then cv2.mean.
+# Scene brightness changes over seconds, and the grid mean stays within a
+# fraction of a level of the full-frame mean, so the 50 threshold keeps its
+# meaning. Accepts BGR frames, a gray/Y plane, packed YUYV (H, W, 2) or an
+# MJPEG packet (1/8-scale gray decode: the luma straight from the DCT).
+class BrightnessMeter:
+    def __init__(self, every=5, stride=4, roi=None, threshold=LOW_LIGHT_THRESHOLD):
+        self.every = max(1, int(every))
+        self.stride = max(1, int(stride))
+        self.roi = roi                                             # (x, y, w, h) as fractions of the frame
+        self.threshold = threshold
+        self.thumb = None                                          # preallocated subsample, reused
+        self.brightness = None
+        self.count = 0
+
+    @property
+    def is_dark(self):
+        return self.brightness is not None and self.brightness < self.threshold
+
+    def update(self, frame):
+        # Latest brightness; only re-measured every `every` frames.
+        if self.count % self.every == 0:
+            self.brightness = self.measure(frame)
+        self.count += 1
+        return self.brightness
+
+    def reset(self):
+        # Forget the cached value, e.g. after the caller skipped frames: the next update() measures.
+        self.brightness = None
+        self.count = 0
+
+    def measure(self, frame):
+        if frame.ndim == 1:
+            return cv2.mean(self._crop(decode_packet(frame, scale=8, gray=True)))[0]
+        frame = self._crop(frame)
+        height, width = frame.shape[:2]
+        shape = ((height + self.stride - 1) // self.stride, (width + self.stride - 1) // self.stride) + frame.shape[2:]
+        if self.thumb is None or self.thumb.shape != shape:
+            self.thumb = np.empty(shape, dtype=np.uint8)
+        cv2.resize(frame, (shape[1], shape[0]), dst=self.thumb, interpolation=cv2.INTER_NEAREST)
+        means = cv2.mean(self.thumb)
+        if frame.ndim == 2 or frame.shape[2] == 2:
+            return means[0]                                        # gray / Y plane / YUYV (Y is channel 0)
+        return means[0] * GRAY_WEIGHTS[0] + means[1] * GRAY_WEIGHTS[1] + means[2] * GRAY_WEIGHTS[2]
+
+    def _crop(self, frame):
+        if not self.roi:
+            return frame
+        height, width = frame.shape[:2]
+        x, y, w, h = self.roi
+        return frame[int(y * height):int((y + h) * height), int(x * width):int((x + w) * width)]
@@ -0,0 +1,143 @@
+# camera_broker.py
+import signal
+import sys
+
+import cv2
+import numpy as np
+
+from capture import CaptureThread, open_camera
+from frame_bus import FrameBus, FrameBusReader
+
+# ---------- Config ----------
+BROKER_BUS = "vt_camera"
+CAMERA_INDEX = 3
+RESOLUTION = (640, 480)
+FPS = 20
+BUS_SLOTS = 16  # ~0.8 s at 20 fps: how far a subscriber may lag before it skips ahead
+
+
+# Opens the camera once and publishes every frame on the shared-memory bus.
+# main_subscribe.py (USE_CAMERA_BROKER) and the simulator's cameras attach with
+# BrokerCapture instead of opening /dev/video* themselves, so none of them has
+# to wait for the device lock and all of them see every frame.
+def run_broker(camera_index=CAMERA_INDEX, resolution=RESOLUTION, fps=FPS, bus_name=BROKER_BUS, slots=BUS_SLOTS):
+    cap, _ = open_camera(camera_index, resolution, fps, mjpeg=True)
+    if not cap.isOpened():
+        print(f"❌ Broker could not open camera {camera_index}.")
+        return
+
+    capture = CaptureThread(cap, resolution, queue_size=2, name="broker-capture").start()
+    first = capture.read(timeout=5)
+    if first is None:
+        print("❌ Broker got no frame from the camera.")
+        capture.stop()
+        cap.release()
+        return
+
+    bus = FrameBus.create(bus_name, slots, first.image.shape)
+    print(f"📡 Camera broker publishing {first.image.shape[1]}x{first.image.shape[0]} on '{bus_name}'.")
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+
+    item = first
+    try:
+        while item is not None:
+            bus.publish(item.image, item.timestamp)
+            item = capture.read(timeout=5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.stop()
+        cap.release()
+        bus.close()
+        print(f"🛑 Camera broker stopped. Stats: {capture.stats()}")
+
+
+# cv2.VideoCapture look-alike reading from the broker. Each instance has its own
+# FrameBusReader cursor, so several readers in one or many processes all get
+# every frame. fps decimates on capture timestamps, resolution resizes straight
+# out of the shared slot; the only copy is the one into the caller's image.
+class BrokerCapture:
+    def __init__(self, bus_name=BROKER_BUS, fps=None, resolution=None, timeout=5.0):
+        self.timeout = timeout
+        try:
+            self.reader = FrameBusReader(bus_name, timeout)
+        except FileNotFoundError:
+            print(f"❌ Camera broker '{bus_name}' is not running.")
+            self.reader = None
+            return
+
+        height, width, channels = self.reader.shape
+        self.resolution = tuple(resolution) if resolution else (width, height)
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_due = 0.0
+        self.grabbed = None
+
+    @property
+    def skipped(self):
+        return self.reader.lagged if self.reader else 0         # frames lost by lagging > ring size
+
+    def isOpened(self):
+        return self.reader is not None
+
+    def grab(self):
+        if self.reader is None:
+            return False
+        while True:
+            frame = self.reader.next(self.timeout)
+            if frame is None:
+                return False                                      # broker stalled or gone
+            if self.interval and frame.timestamp < self.next_due:
+                continue                                          # decimated for this reader's fps
+            # Keep the cadence, but restart it after a gap instead of bursting to catch up
+            if frame.timestamp - self.next_due > self.interval:
+                self.next_due = frame.timestamp + self.interval
+            else:
+                self.next_due += self.interval
+            self.grabbed = frame
+            return True
+
+    def retrieve(self, image=None, flag=0):
+        frame, self.grabbed = self.grabbed, None
+        if frame is None:
+            return False, None
+        width, height = self.resolution
+        if image is None or image.shape != (height, width, frame.image.shape[2]):
+            image = np.empty((height, width, frame.image.shape[2]), dtype=np.uint8)
+        if image.shape == frame.image.shape:
+            image[...] = frame.image
+        else:
+            cv2.resize(frame.image, (width, height), dst=image, interpolation=cv2.INTER_AREA)
+        if not self.reader.valid(frame):
+            return False, None                                    # publisher lapped us mid-copy
+        return True, image
+
+    def read(self, image=None):
+        while self.grab():
+            ret, frame = self.retrieve(image)
+            if ret:
+                return ret, frame
+        return False, None
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.resolution[0])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.resolution[1])
+        if prop == cv2.CAP_PROP_FPS:
+            return 1.0 / self.interval if self.interval else float(FPS)
+        return 0.0
+
+    def set(self, prop, value):
+        return False                                              # the broker owns the device settings
+
+    def release(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+if __name__ == "__main__":
+    run_broker(int(sys.argv[1]) if len(sys.argv) > 1 else CAMERA_INDEX)
@@ -0,0 +1,230 @@
+# camera_discovery.py
+import concurrent.futures
+import fcntl
+import glob
+import json
+import os
+import re
+import struct
+
+# Cameras are found through sysfs and queried with V4L2 ioctls instead of
+# opening cv2.VideoCapture(i) for i in 0..4: no index probing, no streaming
+# setup, all devices in parallel. Capabilities are cached per physical camera
+# (USB port + vendor/product/serial), so a warm start only reads sysfs.
+SYSFS_ROOT = "/sys/class/video4linux"
+CACHE_PATH = os.path.expanduser(os.environ.get("CAMERA_CACHE", "~/.cache/video_telematics/cameras.json"))
+
+# ioctl numbers from linux/videodev2.h (_IOR/_IOWR('V', nr, struct))
+VIDIOC_QUERYCAP = 0x80685600
+VIDIOC_ENUM_FMT = 0xC0405602
+VIDIOC_ENUM_FRAMESIZES = 0xC02C564A
+VIDIOC_ENUM_FRAMEINTERVALS = 0xC034564B
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_FRMSIZE_TYPE_DISCRETE = 1
+V4L2_FRMIVAL_TYPE_DISCRETE = 1
+
+
+def _read(path, default=""):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+
+def _usb_identity(device_dir):
+    # Walk up from the interface to the USB device that carries idVendor/idProduct/serial.
+    path = os.path.realpath(device_dir)
+    while path != "/":
+        if os.path.exists(os.path.join(path, "idVendor")):
+            return ":".join(_read(os.path.join(path, name)) for name in ("idVendor", "idProduct", "serial"))
+        path = os.path.dirname(path)
+    return ""
+
+
+def list_video_devices():
+    # [{index, path, name, identity}] from sysfs only; nothing is opened.
+    devices = []
+    for node in glob.glob(os.path.join(SYSFS_ROOT, "video*")):
+        match = re.fullmatch(r"video(\d+)", os.path.basename(node))
+        if not match:
+            continue
+        device_dir = os.path.join(node, "device")
+        port = os.path.basename(os.path.realpath(device_dir))
+        name = _read(os.path.join(node, "name"))
+        devices.append({
+            "index": int(match.group(1)),
+            "path": f"/dev/{os.path.basename(node)}",
+            "name": name,
+            # node index inside the device: UVC cameras expose a capture node (0) and a metadata node (1)
+            "node": int(_read(os.path.join(node, "index"), "0") or 0),
+            "identity": f"{port}|{_usb_identity(device_dir)}|{name}|{_read(os.path.join(node, 'index'), '0')}",
+        })
+    return sorted(devices, key=lambda device: device["index"])
+
+
+def _fourcc(code):
+    return code.to_bytes(4, "little").decode(errors="replace")
+
+
+def _frame_rates(fd, pixelformat, width, height):
+    rates = []
+    for i in range(64):
+        buf = bytearray(struct.pack("5I", i, pixelformat, width, height, 0) + bytes(32))
+        try:
+            fcntl.ioctl(fd, VIDIOC_ENUM_FRAMEINTERVALS, buf)
+        except OSError:
+            break
+        kind, numerator, denominator = struct.unpack_from("3I", buf, 16)
+        if kind != V4L2_FRMIVAL_TYPE_DISCRETE:
+            rates.append(round(denominator / numerator, 2) if numerator else 0)   # stepwise: report the fastest
+            break
+        if numerator:
+            rates.append(round(denominator / numerator, 2))
+    return sorted(set(rates), reverse=True)
+
+
+def query_capabilities(path):
+    # Formats -> {"WxH": [fps, ...]} through V4L2 ioctls; None if not a capture device.
+    fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+    try:
+        buf = bytearray(104)
+        fcntl.ioctl(fd, VIDIOC_QUERYCAP, buf)
+        driver, card = (field.split(b"\0")[0].decode(errors="replace") for field in struct.unpack_from("16s32s", buf))
+        capabilities, device_caps = struct.unpack_from("2I", buf, 84)
+        caps = device_caps if capabilities & V4L2_CAP_DEVICE_CAPS else capabilities
+        if not caps & V4L2_CAP_VIDEO_CAPTURE:
+            return None
+
+        formats = {}
+        for i in range(32):
+            buf = bytearray(struct.pack("3I", i, V4L2_BUF_TYPE_VIDEO_CAPTURE, 0) + bytes(52))
+            try:
+                fcntl.ioctl(fd, VIDIOC_ENUM_FMT, buf)
+            except OSError:
+                break
+            pixelformat = struct.unpack_from("I", buf, 44)[0]
+            sizes = {}
+            for j in range(64):
+                size = bytearray(struct.pack("3I", j, pixelformat, 0) + bytes(32))
+                try:
+                    fcntl.ioctl(fd, VIDIOC_ENUM_FRAMESIZES, size)
+                except OSError:
+                    break
+                kind, width, height = struct.unpack_from("3I", size, 8)
+                if kind == V4L2_FRMSIZE_TYPE_DISCRETE:
+                    sizes[f"{width}x{height}"] = _frame_rates(fd, pixelformat, width, height)
+                else:
+                    max_width, max_height = struct.unpack_from("2I", size, 16)[0], struct.unpack_from("I", size, 28)[0]
+                    sizes[f"{max_width}x{max_height}"] = _frame_rates(fd, pixelformat, max_width, max_height)
+                    break
+            formats[_fourcc(pixelformat)] = sizes
+        return {"driver": driver, "card": card, "formats": formats}
+    finally:
+        os.close(fd)
+
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache, path=CACHE_PATH):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"⚠️ Could not write camera cache {path}: {e}")
+
+
+def discover_cameras(use_cache=True, max_workers=8):
+    # Capture-capable cameras with their formats, sorted by /dev/video index.
+    devices = list_video_devices()
+    if not devices:
+        return []
+    cache = load_cache() if use_cache else {}
+    unknown = [device for device in devices if device["identity"] not in cache]
+
+    if unknown:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(unknown))) as pool:
+            results = pool.map(lambda device: _probe(device["path"]), unknown)
+            for device, caps in zip(unknown, results):
+                if caps is not False:                              # False = busy/unreadable: retry next start
+                    cache[device["identity"]] = caps
+        if use_cache:
+            save_cache(cache)
+
+    cameras = []
+    for device in devices:
+        caps = cache.get(device["identity"])
+        if caps:
+            cameras.append(dict(device, **caps))
+    return cameras
+
+
+def _probe(path):
+    try:
+        return query_capabilities(path)
+    except OSError as e:
+        print(f"⚠️ Could not query {path}: {e}")
+        return False
+
+
+def supports(camera, resolution=None, fps=None, fourcc=None):
+    size = f"{resolution[0]}x{resolution[1]}" if resolution else None
+    for name, sizes in camera["formats"].items():
+        if fourcc and name != fourcc:
+            continue
+        for candidate, rates in sizes.items():
+            if size and candidate != size:
+                continue
+            if fps and rates and max(rates) < fps:
+                continue
+            return True
+    return False
+
+
+def find_camera(resolution=None, fps=None, fourcc=None, max_index=None):
+    # Drop-in for find_working_camera(): lowest index able to deliver the mode,
+    # falling back to any capture camera, then to parallel cv2 probing off Linux.
+    cameras = discover_cameras()
+    if max_index is not None:
+        cameras = [camera for camera in cameras if camera["index"] < max_index]
+    for camera in cameras:
+        if supports(camera, resolution, fps, fourcc):
+            return camera["index"]
+    if cameras:
+        print(f"⚠️ No camera lists {resolution} @ {fps} fps {fourcc or ''}; using video{cameras[0]['index']}.")
+        return cameras[0]["index"]
+    if os.path.isdir(SYSFS_ROOT):
+        return None
+    return probe_indices(max_index or 5)
+
+
+def probe_indices(max_index=5):
+    # Fallback without sysfs: opens indices in parallel instead of one after another.
+    import cv2
+
+    def try_open(index):
+        cap = cv2.VideoCapture(index)
+        ok = cap.isOpened()
+        cap.release()
+        return ok
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_index) as pool:
+        results = list(pool.map(try_open, range(max_index)))
+    return next((index for index, ok in enumerate(results) if ok), None)
+
+
+if __name__ == "__main__":
+    for camera in discover_cameras(use_cache=False):
+        print(f"📷 {camera['path']}  {camera['card']}  [{camera['identity']}]")
+        for name, sizes in camera["formats"].items():
+            print(f"    {name}: " + ", ".join(f"{size}@{max(rates) if rates else '?'}" for size, rates in sizes.items()))
@@ -0,0 +1,134 @@
+# capture.py
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# seq counts every frame the camera delivered (dropped ones included), so gaps
+# in seq downstream show exactly where backpressure cost us frames.
+CapturedFrame = namedtuple("CapturedFrame", ["seq", "timestamp", "image"])
+
+# cv2.imdecode flags for decoding an MJPEG packet at 1/1, 1/2, 1/4 or 1/8 scale;
+# the JPEG decoder skips the work for the dropped resolution (DCT scaling).
+REDUCED_COLOR = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+REDUCED_GRAY = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+
+
+def open_camera(index, resolution, fps, mjpeg=False, passthrough=False):
+    # Returns (cap, passthrough_active). mjpeg=True negotiates MJPG on the wire
+    # (V4L2 otherwise falls back to raw YUYV); passthrough=True additionally asks
+    # OpenCV not to decode, so retrieve() hands back the camera's JPEG bytes.
+    cap = cv2.VideoCapture(index, cv2.CAP_V4L2) if mjpeg else cv2.VideoCapture(index)
+    if mjpeg:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+    cap.set(cv2.CAP_PROP_FPS, fps)
+    if not mjpeg:
+        return cap, False
+
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, "little").decode(errors="replace")
+    if fourcc != "MJPG":
+        print(f"⚠️ Camera refused MJPG (got {fourcc!r}), using decoded frames.")
+        return cap, False
+    if passthrough and cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+        print("📦 MJPEG passthrough: recording the camera's compressed frames.")
+        return cap, True
+    return cap, False
+
+
+def decode_packet(packet, scale=1, gray=False):
+    # Decodes an MJPEG packet only when someone needs pixels, at reduced scale if asked.
+    flags = REDUCED_GRAY[scale] if gray else REDUCED_COLOR[scale]
+    return cv2.imdecode(packet, flags)
+
+
+# Reads the camera on its own thread so encoding, detection, GUI or clip saving
+# can never lower the capture rate. grab() runs for every frame; retrieve()
+# (the decode) only when the downstream queue has room. When it is full the
+# frame is counted as dropped instead of blocking the camera. In passthrough
+# mode image is the frame's compressed MJPEG packet (1-D uint8), not pixels.
+class CaptureThread:
+    def __init__(self, cap, resolution, queue_size=4, name="capture", passthrough=False):
+        self.cap = cap
+        self.passthrough = passthrough
+        self.frames = queue.Queue(maxsize=queue_size)
+        width, height = resolution
+        # queue_size + 2 buffers: the queued frames, the one the consumer holds
+        # and the one being decoded never share memory.
+        self.pool = [] if passthrough else [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(queue_size + 2)]
+        self.next_buffer = 0
+        self.seq = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.running = False
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def read(self, timeout=None):
+        # Next CapturedFrame, or None once the camera stopped delivering.
+        # The image stays valid until the following read() call.
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=2)
+
+    def stats(self):
+        return {"captured": self.seq, "delivered": self.delivered, "dropped": self.dropped,
+                "queued": self.frames.qsize()}
+
+    def _run(self):
+        while self.running:
+            if not self.cap.grab():
+                print("⚠️ Camera grab failed, capture thread stopping.")
+                break
+            timestamp = time.monotonic()
+            self.seq += 1
+
+            if self.frames.full():
+                self.dropped += 1                                  # skip the decode entirely
+                continue
+
+            if self.passthrough:
+                ret, image = self.cap.retrieve()                   # packet size varies, nothing to pool
+                if ret:
+                    image = image.reshape(-1)
+            else:
+                buffer = self.pool[self.next_buffer]
+                ret, image = self.cap.retrieve(image=buffer)
+                if ret and image is not buffer:
+                    self.pool[self.next_buffer] = image            # camera size differs; reuse what OpenCV allocated
+                self.next_buffer = (self.next_buffer + 1) % len(self.pool)
+            if not ret:
+                self.dropped += 1
+                continue
+
+            self.frames.put(CapturedFrame(self.seq, timestamp, image))
+            self.delivered += 1
+
+        self.running = False
+        self._put_end()
+
+    def _put_end(self):
+        while True:
+            try:
+                self.frames.put_nowait(None)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    pass
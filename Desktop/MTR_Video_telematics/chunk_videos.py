@@ -5,7 +5,12 @@ import fcntl
 import time
 import signal
 
-def is_camera_available(dev="/dev/video3"):
+DEVICE = "/dev/video3"
+OUTPUT_DIR = "/home/csg"
+CHUNK_SECONDS = 20
+MAX_RESTART_DELAY = 30  # seconds between ffmpeg restarts, at most
+
+def is_camera_available(dev=DEVICE):
     try:
         with open(dev, 'rb') as cam:
             fcntl.flock(cam, fcntl.LOCK_EX | fcntl.LOCK_NB)
@@ -14,36 +19,96 @@ def is_camera_available(dev="/dev/video3"):
     except (OSError, IOError):
         return False
 
-def record_video(duration=20, dev="/dev/video3"):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    output_file = f"/home/csg/video_{timestamp}.mp4"
-    print(f"Recording video: {output_file}")
+def detect_compressed_format(dev=DEVICE):
+    # Returns "h264" or "mjpeg" if the camera can deliver an already compressed
+    # stream (then chunks are stream-copied, no transcoding), else None.
+    try:
+        probe = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-f", "v4l2", "-list_formats", "compressed", "-i", dev],
+            capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    formats = probe.stderr.lower()
+    for fmt in ("h264", "mjpeg"):
+        if f" {fmt} " in formats:
+            return fmt
+    return None
+
+def build_segment_command(dev=DEVICE, duration=CHUNK_SECONDS, output_dir=OUTPUT_DIR, input_format=None):
+    # One long-lived ffmpeg: the segment muxer cuts gapless, timestamp-named chunks.
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "warning", "-f", "v4l2"]
+    if input_format:
+        cmd += ["-input_format", input_format]
+    cmd += ["-i", dev]
 
+    if input_format == "h264":
+        cmd += ["-c:v", "copy"]
+        ext = "mp4"
+    elif input_format == "mjpeg":
+        cmd += ["-c:v", "copy"]
+        ext = "mkv"
+    else:
+        # Keyframe exactly on every chunk boundary so segments are cut on time
+        cmd += ["-force_key_frames", f"expr:gte(t,n_forced*{duration})"]
+        ext = "mp4"
+
+    cmd += [
+        "-f", "segment",
+        "-segment_time", str(duration),
+        "-reset_timestamps", "1",
+        "-strftime", "1",
+        os.path.join(output_dir, f"video_%Y-%m-%d_%H-%M-%S.{ext}"),
+    ]
+    return cmd
+
+def record_segments(dev=DEVICE, duration=CHUNK_SECONDS, output_dir=OUTPUT_DIR, input_format=None):
+    # Runs the segmenting ffmpeg until it exits; returns (exit code, seconds it ran).
+    os.makedirs(output_dir, exist_ok=True)
+    cmd = build_segment_command(dev, duration, output_dir, input_format)
+    print(f"Recording {duration}s chunks into {output_dir} ({input_format or 'encoded'})")
+    started = time.monotonic()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
     try:
-        subprocess.run([
-            "ffmpeg",
-            "-f", "v4l2",
-            "-i", dev,
-            "-t", str(duration),
-            output_file
-        ], check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"FFmpeg failed: {e}")
-    finally:
-        print(f"Finished recording: {output_file}")
-
-def continuous_recording():
+        return proc.wait(), time.monotonic() - started
+    except KeyboardInterrupt:
+        # SIGINT lets ffmpeg finalize the chunk it is writing
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        raise
+
+def continuous_recording(dev=DEVICE, duration=CHUNK_SECONDS, output_dir=OUTPUT_DIR):
     print("Starting continuous video recording...")
-    
-    while True:
-        if not is_camera_available():
-            print("Camera is busy. Waiting 5 seconds before retrying...")
-            time.sleep(5)  # Wait before checking again
-            continue  # Retry if the device is busy
+    signal.signal(signal.SIGTERM, signal.default_int_handler)  # stop cleanly under systemd too
+    input_format = None
+    probed = False
+    restart_delay = 1
 
-        record_video()  # Record video in chunks of 10 seconds 
-        time.sleep(1)  # Pause for a second before starting the next recording
+    try:
+        while True:
+            if not is_camera_available(dev):
+                print("Camera is busy. Waiting 5 seconds before retrying...")
+                time.sleep(5)  # Wait before checking again
+                continue  # Retry if the device is busy
+
+            if not probed:
+                input_format = detect_compressed_format(dev)
+                probed = True
+
+            code, ran_for = record_segments(dev, duration, output_dir, input_format)
+            print(f"{datetime.datetime.now():%H:%M:%S} ffmpeg exited with code {code} after {ran_for:.0f}s")
+
+            if ran_for > 60:
+                restart_delay = 1  # it was healthy; restart straight away
+            elif input_format and ran_for < 5:
+                print(f"Stream copy of {input_format} failed, falling back to encoding.")
+                input_format = None
+            time.sleep(restart_delay)
+            restart_delay = min(restart_delay * 2, MAX_RESTART_DELAY)
+    except KeyboardInterrupt:
+        print("Recording stopped.")
 
 if __name__ == "__main__":
     continuous_recording()
-
@@ -0,0 +1,257 @@
+# compressed_buffer.py
+import subprocess
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from packet_tap import PAT_PID, TS_PACKET_SIZE, TS_SYNC_BYTE, is_keyframe_start, parse_pat
+from video_writer import FFMPEG_CODEC, encoder_args
+
+DEFAULT_BUDGET = 48 * 1024 * 1024                                  # bytes of encoded pre-roll
+QUALITY_STEP = 5
+QUALITY_SETTLE_FRAMES = 10                                         # frames between two quality steps
+
+
+# Pre-roll buffer that keeps every frame JPEG-encoded instead of as raw BGR.
+# A 640x480 frame is ~900 KB raw but ~10-40 KB as JPEG, so minutes of pre-roll
+# fit in tens of MB. Frames are decoded only when an incident clip is written.
+# Quality is steered by the size a full window would have at the current
+# average frame size, so it settles long before the budget is reached; evicting
+# the oldest frames is the last resort (scenes too busy even at min_quality).
+class JpegFrameBuffer:
+    def __init__(self, maxlen, quality=80, max_bytes=DEFAULT_BUDGET, min_quality=30):
+        self.maxlen = int(maxlen)
+        self.quality = int(quality)
+        self.max_quality = int(quality)
+        self.min_quality = int(min_quality)
+        self.max_bytes = int(max_bytes)                            # memory budget for the encoded frames
+        self.packets = deque()
+        self.nbytes = 0
+        self.mean_bytes = 0.0                                      # running average frame size
+        self.since_step = 0
+        self.evicted = 0                                           # frames dropped early to respect the budget
+        self.warned = False
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.packets)
+
+    def append(self, frame):
+        ok, packet = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            print("⚠️ JPEG encode failed, frame not buffered.")
+            return
+
+        with self.lock:
+            self.packets.append(packet)
+            self.nbytes += packet.nbytes
+            if len(self.packets) > self.maxlen:
+                self.nbytes -= self.packets.popleft().nbytes
+            self._steer_quality(packet.nbytes)
+            self._evict()
+
+    def append_packet(self, packet):
+        # Frame that is already JPEG (MJPEG camera passthrough): stored as-is, no encode.
+        with self.lock:
+            self.packets.append(packet)
+            self.nbytes += packet.nbytes
+            if len(self.packets) > self.maxlen:
+                self.nbytes -= self.packets.popleft().nbytes
+            self._evict()
+
+    def _steer_quality(self, nbytes):
+        # Caller holds the lock. Down while a full window would not fit the budget,
+        # back up (to the configured quality) once it would fit with room to spare.
+        self.mean_bytes = nbytes if not self.mean_bytes else 0.9 * self.mean_bytes + 0.1 * nbytes
+        self.since_step += 1
+        if self.since_step < QUALITY_SETTLE_FRAMES:
+            return
+        projected = self.mean_bytes * self.maxlen
+        if projected > self.max_bytes and self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - QUALITY_STEP)
+            self.since_step = 0
+        elif projected < 0.75 * self.max_bytes and self.quality < self.max_quality:
+            self.quality = min(self.max_quality, self.quality + QUALITY_STEP)
+            self.since_step = 0
+
+    def _evict(self):
+        # Caller holds the lock. Oldest frames go until the budget holds again.
+        while self.nbytes > self.max_bytes and len(self.packets) > 1:
+            self.nbytes -= self.packets.popleft().nbytes
+            self.evicted += 1
+            if not self.warned:
+                self.warned = True
+                print(f"⚠️ Pre-roll over its {self.max_bytes / 2**20:.1f} MB budget: window cut to "
+                      f"{len(self.packets)}/{self.maxlen} frames (quality {self.quality}).")
+
+    def snapshot(self):
+        # Encoded packets, oldest first; cheap enough to take from the capture thread.
+        with self.lock:
+            return list(self.packets)
+
+    def frames(self):
+        # Lazily decoded frames of the current window (oldest first), one at a time.
+        packets = self.snapshot()
+        return (cv2.imdecode(packet, cv2.IMREAD_COLOR) for packet in packets)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "frames": len(self.packets),
+                "bytes": self.nbytes,
+                "quality": self.quality,
+                "evicted": self.evicted,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.packets.clear()
+            self.nbytes = 0
+            self.warned = False
+
+
+# Encoded-packet mode: frames go through one ffmpeg H.264 encoder (MPEG-TS on a
+# pipe) and the buffer keeps whole GOPs of the output, like EncodedLoopTap does
+# for incident cuts. Inter-frame coding makes a 640x480 minute a few MB where
+# JPEG needs tens; the capture side pays one pipe write per frame. frames()
+# decodes a snapshot of the window with a short-lived second ffmpeg.
+class EncodedFrameBuffer:
+    def __init__(self, seconds, resolution, fps, max_bytes=DEFAULT_BUDGET, codec=FFMPEG_CODEC, gop_seconds=1.0,
+                 ffmpeg="ffmpeg"):
+        self.seconds = seconds
+        self.resolution = resolution
+        self.max_bytes = int(max_bytes)
+        self.ffmpeg = ffmpeg
+        self.gops = deque()                                        # [arrival_time, bytearray] oldest first
+        self.header_packets = {}                                   # latest PAT / PMT packet by PID
+        self.pmt_pids = set()
+        self.nbytes = 0                                            # closed GOPs only
+        self.evicted = 0                                           # GOPs dropped early to respect the budget
+        self.warned = False
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()                         # recording loop and post capture both append
+
+        width, height = resolution
+        # zerolatency (no lookahead) and flush_packets (no 32 KB output buffer): the
+        # newest frames are already in the ring when an incident hits
+        tune = ["-tune", "zerolatency"] if codec == "libx264" else []
+        cmd = [
+            ffmpeg, "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0",
+        ] + encoder_args(fps, codec=codec, gop_seconds=gop_seconds) + tune + [
+            "-bf", "0", "-flush_packets", "1", "-f", "mpegts", "pipe:1"]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.reader = threading.Thread(target=self._read_stream, name="preroll-reader", daemon=True)
+        self.reader.start()
+
+    def append(self, frame):
+        with self.write_lock:
+            try:
+                self.proc.stdin.write(frame.data if frame.flags.c_contiguous else frame.tobytes())
+            except (BrokenPipeError, ValueError):
+                print("⚠️ Pre-roll encoder closed, frame not buffered.")
+
+    def snapshot(self):
+        # The window as one MPEG-TS byte string: stream headers, then every GOP.
+        with self.lock:
+            parts = [self.header_packets[pid] for pid in sorted(self.header_packets)]
+            parts += [data for _, data in self.gops]
+            return b"".join(parts)
+
+    def frames(self):
+        # Frames of the current window (oldest first), decoded one at a time.
+        return self._decode(self.snapshot())
+
+    def stats(self):
+        with self.lock:
+            return {
+                "gops": len(self.gops),
+                "bytes": self.nbytes + (len(self.gops[-1][1]) if self.gops else 0),
+                "evicted": self.evicted,
+            }
+
+    def close(self):
+        if not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.proc.wait()
+        self.reader.join()
+
+    def _decode(self, data):
+        width, height = self.resolution
+        size = width * height * 3
+        proc = subprocess.Popen([
+            self.ffmpeg, "-loglevel", "error", "-f", "mpegts", "-i", "pipe:0",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "pipe:1",
+        ], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        feeder = threading.Thread(target=self._feed, args=(proc.stdin, data), daemon=True)
+        feeder.start()
+        try:
+            while True:
+                raw = proc.stdout.read(size)
+                if len(raw) < size:
+                    break
+                yield np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 3)
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()                                        # consumer stopped early
+            proc.wait()
+            feeder.join()
+
+    @staticmethod
+    def _feed(stdin, data):
+        try:
+            stdin.write(data)
+            stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    def _read_stream(self):
+        pending = b""
+        while True:
+            chunk = self.proc.stdout.read(TS_PACKET_SIZE * 64)
+            if not chunk:
+                break
+            pending += chunk
+            usable = len(pending) - len(pending) % TS_PACKET_SIZE
+            with self.lock:
+                for offset in range(0, usable, TS_PACKET_SIZE):
+                    self._handle_packet(pending[offset:offset + TS_PACKET_SIZE])
+            pending = pending[usable:]
+
+    def _handle_packet(self, packet):
+        if packet[0] != TS_SYNC_BYTE:
+            return
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        if pid == PAT_PID:
+            self.header_packets[pid] = packet
+            self.pmt_pids.update(parse_pat(packet))
+        elif pid in self.pmt_pids:
+            self.header_packets[pid] = packet
+
+        if is_keyframe_start(packet):
+            self._close_gop()
+            self.gops.append([time.monotonic(), bytearray()])
+        if self.gops:
+            self.gops[-1][1] += packet
+
+    def _close_gop(self):
+        # Caller holds the lock. Trim to `seconds`, then to the budget.
+        if self.gops:
+            self.nbytes += len(self.gops[-1][1])
+        horizon = time.monotonic() - self.seconds
+        while len(self.gops) > 1 and self.gops[1][0] <= horizon:
+            self.nbytes -= len(self.gops.popleft()[1])
+        while self.nbytes > self.max_bytes and len(self.gops) > 1:
+            self.nbytes -= len(self.gops.popleft()[1])
+            self.evicted += 1
+            if not self.warned:
+                self.warned = True
+                print(f"⚠️ Pre-roll over its {self.max_bytes / 2**20:.1f} MB budget: window cut to "
+                      f"{time.monotonic() - self.gops[0][0]:.0f}/{self.seconds} s.")
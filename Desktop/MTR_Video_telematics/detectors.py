@@ -0,0 +1,398 @@
+# detectors.py
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from brightness import BrightnessMeter, LOW_LIGHT_THRESHOLD
+from capture import decode_packet
+from kinematics import KinematicsTrack, flag_events
+from telemetry_batch import BATCH_FIELDS
+
+
+# Every detector - video or telemetry - reports into one TriggerBus. A source
+# is either active (incident condition holds) or not; listeners are called on
+# each transition with the set of sources still active, so an incident lasts
+# until the last source that raised it has cleared.
+class TriggerBus:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}                                           # source -> detail of the last trigger
+        self.listeners = []
+
+    def subscribe(self, listener):
+        # listener(source, active, detail, active_sources)
+        self.listeners.append(listener)
+
+    def report(self, source, active, detail=""):
+        with self.lock:
+            if active == (source in self.active):
+                return
+            if active:
+                self.active[source] = detail
+            else:
+                del self.active[source]
+            sources = set(self.active)
+        for listener in self.listeners:
+            listener(source, active, detail, sources)
+
+    def forget(self, source):
+        # Drops a source that went silent without notifying; its next report starts fresh.
+        with self.lock:
+            self.active.pop(source, None)
+
+    def active_sources(self):
+        with self.lock:
+            return set(self.active)
+
+
+# Base classes. process()/on_message() return None when they have no opinion
+# on this input, else (active, detail).
+class VideoDetector:
+    name = "video"
+    fps = 5.0                                                      # evaluations per second
+    level = 2                                                      # pyramid level: 0 = full, 1 = 1/2, 2 = 1/4 ...
+
+    def process(self, image, timestamp):
+        raise NotImplementedError
+
+
+class TelemetryDetector:
+    name = "telemetry"
+
+    def on_message(self, payload, timestamp):
+        raise NotImplementedError
+
+    def on_batch(self, batch, timestamp):
+        # Columns from telemetry_batch.unpack_batch(). Fallback: sample by sample,
+        # active if any sample was; detectors override this with one vectorized pass.
+        result = None
+        for i in range(len(batch["speed"])):
+            sample = {field: batch[field][i].item() for field in BATCH_FIELDS}
+            sample["vehicle_id"] = batch["vehicle_id"]
+            r = self.on_message(sample, timestamp)
+            if r is not None and (result is None or not result[0]):
+                result = r
+        return result
+
+
+class SpeedDetector(TelemetryDetector):
+    name = "speed"
+
+    def __init__(self, threshold=120, zones=None):
+        self.threshold = threshold                                 # km/h
+        self.zones = zones                                         # GeofenceIndex: per-zone limits instead
+        self.speed_only = zones is None                            # can run on telemetry_codec.read_speed()
+
+    def on_speed(self, speed):
+        return self._result(speed, self.threshold, None)
+
+    def on_message(self, payload, timestamp):
+        speed = payload.get("speed", 0)
+        limit, zone = self.threshold, None
+        if self.zones is not None and "latitude" in payload and "longitude" in payload:
+            limit, zone = self.zones.limit_at(payload["latitude"], payload["longitude"], payload.get("vehicle_id"))
+        return self._result(speed, limit, zone)
+
+    def on_batch(self, batch, timestamp):
+        # Worst sample of the batch decides: one comparison over the whole speed column
+        speeds = np.nan_to_num(batch["speed"], nan=0.0)            # missing speed counts as 0, as in on_message
+        if not len(speeds):
+            return None
+        if self.zones is None:
+            i = int(np.argmax(speeds))
+            return self._result(speeds[i], self.threshold, None)
+        vehicle = batch["vehicle_id"] or None
+        zones = [self.zones.limit_at(lat, lon, vehicle) if lat == lat and lon == lon else (self.threshold, None)
+                 for lat, lon in zip(batch["latitude"].tolist(), batch["longitude"].tolist())]
+        i = int(np.argmax(speeds - np.array([limit for limit, _ in zones])))
+        return self._result(speeds[i], *zones[i])
+
+    def _result(self, speed, limit, zone):
+        where = f" in {zone}, limit {limit:.0f} km/h" if zone else ""
+        if speed > limit:
+            return True, f"High speed detected ({speed:.2f} km/h{where})"
+        return False, f"Speed normalized ({speed:.2f} km/h{where})"
+
+
+# Harsh braking, crash deceleration and GPS/speed disagreement from the recent
+# history of each vehicle. on_message() only appends to the vehicle's ring;
+# the vectorized analysis runs every `every_seconds` of telemetry time over all
+# samples received since, so the cost per message stays flat at 100 Hz+.
+# A batch message is analyzed as a whole as soon as it arrives.
+class KinematicsDetector(TelemetryDetector):
+    name = "kinematics"
+
+    def __init__(self, every_seconds=0.1, hold_seconds=3.0, capacity=1024):
+        self.every_seconds = every_seconds
+        self.hold_seconds = hold_seconds
+        self.capacity = capacity
+        self.tracks = {}                                           # vehicle_id -> KinematicsTrack
+        self.active = set()                                        # vehicles inside their hold time
+
+    def on_message(self, payload, timestamp):
+        vehicle = payload.get("vehicle_id", "")
+        track = self._track(vehicle)
+        timestamp = payload.get("timestamp", timestamp)            # sample time when the publisher sends one
+        track.append(timestamp, payload.get("latitude", np.nan), payload.get("longitude", np.nan),
+                     payload.get("speed", np.nan))
+        if timestamp < track.next_analysis:
+            return None
+        return self._evaluate(vehicle, track, timestamp)
+
+    def on_batch(self, batch, timestamp):
+        # Whole batch appended with one block copy and analyzed in one pass
+        if not len(batch["speed"]):
+            return None
+        vehicle = batch["vehicle_id"]
+        track = self._track(vehicle)
+        timestamps = batch["timestamp"]
+        if np.isnan(timestamps).any():
+            timestamps = np.full(len(timestamps), timestamp)
+        track.extend(timestamps, batch["latitude"], batch["longitude"], batch["speed"])
+        return self._evaluate(vehicle, track, float(timestamps[-1]))
+
+    def _track(self, vehicle):
+        track = self.tracks.get(vehicle)
+        if track is None:
+            track = self.tracks[vehicle] = KinematicsTrack(self.capacity)
+        return track
+
+    def _evaluate(self, vehicle, track, timestamp):
+        track.next_analysis = timestamp + self.every_seconds
+        metrics = track.analyze()
+        event = flag_events(metrics) if metrics else None
+        if event:
+            track.hold_until = timestamp + self.hold_seconds
+            self.active.add(vehicle)
+            return True, f"{event[1]}{f' [{vehicle}]' if vehicle else ''}"
+        if vehicle in self.active and timestamp >= track.hold_until:
+            self.active.discard(vehicle)
+            if not self.active:
+                return False, "Driving normal again"
+        return None
+
+
+class LowLightDetector(VideoDetector):
+    name = "low_light"
+
+    def __init__(self, threshold=LOW_LIGHT_THRESHOLD, fps=2.0, level=2):
+        self.fps = fps
+        self.level = level
+        self.meter = BrightnessMeter(every=1, stride=1, threshold=threshold)   # input is already downscaled
+
+    def process(self, image, timestamp):
+        brightness = self.meter.measure(image)
+        if brightness < self.meter.threshold:
+            return True, f"Low visibility detected (brightness {brightness:.2f})"
+        return False, f"Visibility restored (brightness {brightness:.2f})"
+
+
+# Sudden scene change (impact, camera knocked off) from a 64x48 gray thumbnail:
+# mean absolute frame difference and histogram distance to the previous
+# thumbnail, each scored against its own rolling mean/std over the last few
+# seconds. Spikes are kept out of the window so an incident does not raise its
+# own baseline. Everything works on preallocated thumbnail-sized arrays: ~0.09 ms
+# per evaluation from any input size, cheap enough to run in the capture process.
+class SceneChangeDetector(VideoDetector):
+    name = "scene_change"
+
+    def __init__(self, fps=10.0, level=2, size=(64, 48), bins=32, window_seconds=5.0, z_threshold=6.0,
+                 min_diff=12.0, min_hist=0.25, hold_seconds=2.0):
+        self.fps = fps
+        self.level = level
+        self.size = size
+        width, height = size
+        self.thumb = np.empty((height, width, 3), dtype=np.uint8)
+        self.gray = np.empty((height, width), dtype=np.uint8)
+        self.prev = np.empty((height, width), dtype=np.uint8)
+        self.diff = np.empty((height, width), dtype=np.uint8)
+        self.bins = bins
+        self.hist = np.zeros(bins, dtype=np.float64)
+        self.prev_hist = np.zeros(bins, dtype=np.float64)
+        self.window = np.zeros((max(8, int(window_seconds * fps)), 2), dtype=np.float64)   # (diff, hist distance)
+        self.floor = np.array([1.0, 0.01])                         # std floors: a static scene is not "infinitely" sensitive
+        self.limits = np.array([min_diff, min_hist])               # absolute minimum change to count
+        self.z_threshold = z_threshold
+        self.hold_seconds = hold_seconds
+        self.filled = 0
+        self.next_index = 0
+        self.has_prev = False
+        self.active_until = None
+
+    def measure(self, image):
+        # (mean abs difference, histogram total-variation distance) to the previous thumbnail
+        # INTER_LINEAR: ~12 us from any input size (INTER_AREA is only fast at exactly 2x)
+        if image.ndim == 2:
+            cv2.resize(image, self.size, dst=self.gray, interpolation=cv2.INTER_LINEAR)
+        else:
+            cv2.resize(image, self.size, dst=self.thumb, interpolation=cv2.INTER_LINEAR)
+            cv2.cvtColor(self.thumb, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        cv2.absdiff(self.gray, self.prev, dst=self.diff)
+        frame_diff = cv2.mean(self.diff)[0]
+        self.hist[:] = cv2.calcHist([self.gray], [0], None, [self.bins], [0, 256]).ravel()
+        self.hist /= self.gray.size
+        hist_distance = 0.5 * float(np.abs(self.hist - self.prev_hist).sum())
+        self.prev, self.gray = self.gray, self.prev
+        self.prev_hist, self.hist = self.hist, self.prev_hist
+        return frame_diff, hist_distance
+
+    def process(self, image, timestamp):
+        values = np.array(self.measure(image))
+        if not self.has_prev:
+            self.has_prev = True
+            return None
+
+        spike = False
+        z = np.zeros(2)
+        if self.filled >= self.window.shape[0] // 2:               # need a baseline first
+            window = self.window[:self.filled]
+            z = (values - window.mean(axis=0)) / np.maximum(window.std(axis=0), self.floor)
+            spike = bool(((z > self.z_threshold) & (values > self.limits)).any())
+        if not spike:
+            self.window[self.next_index] = values
+            self.next_index = (self.next_index + 1) % self.window.shape[0]
+            self.filled = min(self.filled + 1, self.window.shape[0])
+
+        if spike:
+            self.active_until = timestamp + self.hold_seconds
+            return True, f"Scene change detected (diff {values[0]:.1f}, histogram {values[1]:.2f}, z {z.max():.1f})"
+        if self.active_until is not None and timestamp >= self.active_until:
+            self.active_until = None
+            return False, "Scene stable again"
+        return None
+
+
+VIDEO_DETECTOR_TYPES = {"low_light": LowLightDetector, "scene_change": SceneChangeDetector}
+
+
+# Half-resolution levels of one frame, built on demand into preallocated
+# buffers and shared by all video detectors evaluated on that frame.
+class FramePyramid:
+    def __init__(self):
+        self.levels = []
+        self.buffers = []
+
+    def build(self, frame, depth):
+        self.levels = [frame]
+        for i in range(1, depth + 1):
+            src = self.levels[-1]
+            shape = ((src.shape[0] + 1) // 2, (src.shape[1] + 1) // 2) + src.shape[2:]
+            if len(self.buffers) < i:
+                self.buffers.append(None)
+            if self.buffers[i - 1] is None or self.buffers[i - 1].shape != shape:
+                self.buffers[i - 1] = np.empty(shape, dtype=np.uint8)
+            cv2.pyrDown(src, dst=self.buffers[i - 1])
+            self.levels.append(self.buffers[i - 1])
+        return self.levels
+
+
+# Runs video detectors on a decimated copy of the capture stream and telemetry
+# detectors on incoming messages, all reporting into one TriggerBus.
+# offer_frame() is the only call on the capture thread: when no detector is due,
+# or the worker is still busy with the previous frame, it returns immediately;
+# otherwise it copies the frame into the worker's preallocated slot.
+class DetectorPipeline:
+    def __init__(self, trigger_bus, video_detectors=(), telemetry_detectors=()):
+        self.bus = trigger_bus
+        self.video_detectors = list(video_detectors)
+        self.telemetry_detectors = list(telemetry_detectors)
+        self.next_due = {detector: 0.0 for detector in self.video_detectors}
+        self.interval = 1.0 / max((d.fps for d in self.video_detectors), default=1.0)
+        self.pyramid = FramePyramid()
+        self.slot = None                                           # frame handed to the worker
+        self.slot_timestamp = 0.0
+        self.next_offer = 0.0
+        self.ready = threading.Event()
+        self.busy = False
+        self.skipped = 0                                           # frames due while the worker was busy
+        self.running = True
+        self.thread = None
+        if self.video_detectors:
+            self.thread = threading.Thread(target=self._run, name="detectors", daemon=True)
+            self.thread.start()
+
+    # --- capture side ---
+    def offer_frame(self, frame, timestamp):
+        if self.thread is None or timestamp < self.next_offer:
+            return False
+        if self.busy:
+            self.skipped += 1
+            return False
+        self.next_offer = timestamp + self.interval
+        if frame.ndim == 1:
+            self.slot = frame                                      # MJPEG packet: immutable, decoded by the worker
+        else:
+            if self.slot is None or self.slot.shape != frame.shape or self.slot.ndim == 1:
+                self.slot = np.empty_like(frame)
+            self.slot[...] = frame
+        self.slot_timestamp = timestamp
+        self.busy = True
+        self.ready.set()
+        return True
+
+    # --- telemetry side (MQTT / socket thread) ---
+    def offer_message(self, payload, timestamp=None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        for detector in self.telemetry_detectors:
+            self._report(detector, detector.on_message(payload, timestamp))
+
+    @property
+    def speed_only(self):
+        # True when every telemetry detector needs nothing but the speed
+        return all(getattr(d, "speed_only", False) for d in self.telemetry_detectors)
+
+    def offer_speed(self, speed):
+        for detector in self.telemetry_detectors:
+            self._report(detector, detector.on_speed(speed))
+
+    def offer_batch(self, batch, timestamp=None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        for detector in self.telemetry_detectors:
+            self._report(detector, detector.on_batch(batch, timestamp))
+
+    def close(self):
+        self.running = False
+        self.ready.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def _run(self):
+        while True:
+            self.ready.wait()
+            self.ready.clear()
+            if not self.running:
+                break
+            try:
+                self._process_slot()
+            except Exception as e:
+                print(f"❌ Detector frame skipped: {e}")
+            finally:
+                self.busy = False                                  # or offer_frame() would skip every later frame
+
+    def _process_slot(self):
+        image, timestamp = self.slot, self.slot_timestamp
+        due = [d for d in self.video_detectors if timestamp >= self.next_due[d]]
+        if not due:
+            return
+        base = 0                                                   # pyramid level the decoded image is at
+        if image.ndim == 1:
+            # libjpeg scales by 1/2, 1/4 or 1/8 in the IDCT: decode straight at
+            # the finest level any due detector needs, pyrDown only below that
+            base = min(min(d.level for d in due), 3)
+            image = decode_packet(image, scale=2 ** base)
+            if image is None:
+                return                                             # corrupt packet; the next frame is offered as usual
+        levels = self.pyramid.build(image, max(d.level for d in due) - base)
+        for detector in due:
+            self.next_due[detector] = timestamp + 1.0 / detector.fps
+            try:
+                self._report(detector, detector.process(levels[detector.level - base], timestamp))
+            except Exception as e:
+                print(f"❌ Detector {detector.name} failed: {e}")
+
+    def _report(self, detector, result):
+        if result is not None:
+            active, detail = result
+            self.bus.report(detector.name, active, detail)
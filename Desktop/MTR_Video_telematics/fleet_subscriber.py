@@ -0,0 +1,261 @@
+# fleet_subscriber.py
+import sys
+import time
+import threading
+
+import numpy as np
+
+from telemetry_codec import decode
+
+# === CONFIG ===
+BROKER = "localhost"
+TOPIC = "vehicle/+/data"  # one topic per vehicle: vehicle/<id>/data
+SHARED_GROUP = None  # e.g. "fleet": several subscriber processes split the vehicles ($share subscription)
+INCIDENT_SPEED_THRESHOLD = 120  # km/h, wherever no speed zone applies
+SPEED_ZONES_FILE = None  # GeoJSON/CSV of per-zone limits, see geofence.py
+POST_SECONDS = 20  # an incident closes this long after the vehicle's speed normalized
+SILENCE_TIMEOUT = 30  # seconds without a message before a vehicle counts as silent
+TICK_SECONDS = 0.1  # how often queued messages are applied to the table
+REPORT_SECONDS = 10
+INITIAL_VEHICLES = 16384  # table rows preallocated; doubles when the fleet outgrows it
+MAX_EVENT_LINES = 5  # per tick and kind; the rest is summarized
+
+IDLE, ACTIVE, POST = 0, 1, 2
+
+
+# Per-vehicle state as columns of preallocated NumPy arrays, one row per
+# vehicle; the only per-vehicle Python object is the id -> row entry. Updates
+# and state checks for the whole fleet are a few array operations per tick.
+class VehicleTable:
+    def __init__(self, capacity=INITIAL_VEHICLES):
+        self.rows = {}                                             # vehicle id -> row
+        self.ids = []                                              # row -> vehicle id
+        self.capacity = 0
+        self.columns = {
+            "last_seen": np.float64,                               # monotonic receive time, 0: never
+            "speed": np.float32,                                   # latest message's sample furthest over its limit
+            "latitude": np.float64,                                # where that sample was measured
+            "longitude": np.float64,
+            "state": np.uint8,                                     # IDLE / ACTIVE / POST
+            "state_since": np.float64,
+            "silent": np.bool_,
+            "incidents": np.uint32,
+            "messages": np.uint32,
+        }
+        for name, dtype in self.columns.items():
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        self._grow(capacity)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, vehicle_id):
+        row = self.rows.get(vehicle_id)
+        if row is None:
+            row = self.rows[vehicle_id] = len(self.ids)
+            self.ids.append(vehicle_id)
+            if row >= self.capacity:
+                self._grow(2 * self.capacity)
+        return row
+
+    def _grow(self, capacity):
+        for name, dtype in self.columns.items():
+            column = np.zeros(capacity, dtype=dtype)
+            old = getattr(self, name)
+            column[:len(old)] = old
+            setattr(self, name, column)
+        self.capacity = capacity
+
+
+# The MQTT callback only decodes and queues; a tick thread applies everything
+# queued since the last tick to the table in one vectorized pass and advances
+# every vehicle's incident state machine:
+#   IDLE  -> a sample over the limit: incident starts (ACTIVE)
+#   ACTIVE -> messages again, none over the limit: POST
+#   POST  -> over the limit again: ACTIVE; quiet for POST_SECONDS: incident closed (IDLE)
+# A vehicle silent for SILENCE_TIMEOUT is flagged, and an active incident moves
+# to POST, as the single-vehicle watchdog does.
+class FleetMonitor:
+    def __init__(self, threshold=INCIDENT_SPEED_THRESHOLD, zones=None, post_seconds=POST_SECONDS,
+                 silence_timeout=SILENCE_TIMEOUT, tick_seconds=TICK_SECONDS):
+        self.table = VehicleTable()
+        self.threshold = threshold
+        self.zones = zones                                         # GeofenceIndex or None
+        self.post_seconds = post_seconds
+        self.silence_timeout = silence_timeout
+        self.tick_seconds = tick_seconds
+        self.lock = threading.Lock()
+        self.pending = []                                          # (vehicle id, speed, lat, lon, samples)
+        self.running = True
+        self.received = 0                                          # messages / samples since the last report
+        self.samples = 0
+        self.tick_time = 0.0
+        self.ticks = 0
+        self.last_report = time.monotonic()
+
+    # --- MQTT thread ---
+    def on_message(self, client, userdata, msg):
+        try:
+            vehicle_id = msg.topic.split("/")[1]
+            payload, batch = decode(msg.payload)
+            if batch is not None:
+                if not len(batch["speed"]):
+                    return
+                # The sample furthest over the limit at its own position stands for the
+                # batch, so the tick checks it against the zone where it was measured
+                i = int(np.nanargmax(batch["speed"] - self._batch_limits(vehicle_id, batch)))
+                item = (vehicle_id, float(batch["speed"][i]), float(batch["latitude"][i]),
+                        float(batch["longitude"][i]), len(batch["speed"]))
+            else:
+                # float() here: a malformed value drops this message instead of failing the whole tick
+                item = (vehicle_id, float(payload.get("speed", 0)), float(payload.get("latitude", np.nan)),
+                        float(payload.get("longitude", np.nan)), 1)
+        except Exception as e:
+            print(f"⚠️ Bad message on {msg.topic}: {e}")
+            return
+        with self.lock:
+            self.pending.append(item)
+
+    # --- tick thread ---
+    def run(self):
+        next_tick = time.monotonic()
+        while self.running:
+            next_tick += self.tick_seconds
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+            now = time.monotonic()
+            try:
+                self.tick(now)
+                if now - self.last_report >= REPORT_SECONDS:
+                    self.report(now)
+            except Exception as e:
+                print(f"❌ Fleet tick failed: {e}")
+
+    def tick(self, now):
+        started = time.perf_counter()
+        with self.lock:
+            pending, self.pending = self.pending, []
+        table = self.table
+        seen = over = np.zeros(0, dtype=np.int64)
+        if pending:
+            ids, speeds, lats, lons, counts = zip(*pending)
+            rows = np.fromiter(map(table.row, ids), dtype=np.int64, count=len(ids))
+            speeds = np.array(speeds, dtype=np.float32)
+            # Messages arrive in order, so for repeated rows the last assignment wins
+            table.speed[rows] = speeds
+            table.latitude[rows] = lats
+            table.longitude[rows] = lons
+            table.last_seen[rows] = now
+            np.add.at(table.messages, rows, 1)
+            self.received += len(pending)
+            self.samples += sum(counts)
+            seen = np.unique(rows)
+            over = np.unique(rows[speeds > self._limits(ids, lats, lons)])
+
+        state, since = table.state, table.state_since
+        # Over the limit: start (IDLE) or resume (POST) the incident
+        starting = over[state[over] == IDLE]
+        state[over] = ACTIVE
+        since[over] = now
+        table.incidents[starting] += 1
+        self._log("🚧", "incident started", starting)
+
+        # Reported again, but nothing over the limit: post-incident
+        calmed = seen[state[seen] == ACTIVE]
+        calmed = calmed[~np.isin(calmed, over, assume_unique=True)]
+        state[calmed] = POST
+        since[calmed] = now
+
+        # Silence: flagged once, cleared by the next message
+        n = len(table)
+        table.silent[seen] = False
+        silenced = np.flatnonzero(~table.silent[:n] & (table.last_seen[:n] > 0) &
+                                  (table.last_seen[:n] < now - self.silence_timeout))
+        table.silent[silenced] = True
+        self._log("⚠️", f"silent for {self.silence_timeout}s", silenced)
+        cut_off = silenced[state[silenced] == ACTIVE]
+        state[cut_off] = POST
+        since[cut_off] = now
+
+        closed = np.flatnonzero((state[:n] == POST) & (now - since[:n] >= self.post_seconds))
+        state[closed] = IDLE
+        self._log("✅", "incident closed", closed)
+
+        self.tick_time += time.perf_counter() - started
+        self.ticks += 1
+
+    def _limits(self, ids, lats, lons):
+        if self.zones is None:
+            return self.threshold
+        return np.array([self._limit_at(vehicle, lat, lon) for vehicle, lat, lon in zip(ids, lats, lons)])
+
+    def _batch_limits(self, vehicle_id, batch):
+        if self.zones is None:
+            return self.threshold
+        return self._limits([vehicle_id] * len(batch["speed"]), batch["latitude"].tolist(),
+                            batch["longitude"].tolist())
+
+    def _limit_at(self, vehicle_id, lat, lon):
+        if lat != lat or lon != lon:                               # no fix in this sample
+            return self.threshold
+        return self.zones.limit_at(lat, lon, vehicle_id)[0]
+
+    def _log(self, emoji, text, rows):
+        for row in rows[:MAX_EVENT_LINES]:
+            print(f"{emoji} {self.table.ids[row]}: {text} ({self.table.speed[row]:.1f} km/h)")
+        if len(rows) > MAX_EVENT_LINES:
+            print(f"{emoji} ... and {len(rows) - MAX_EVENT_LINES} more vehicles: {text}")
+
+    def report(self, now):
+        elapsed = max(now - self.last_report, 1e-9)
+        table, n = self.table, len(self.table)
+        print(f"📈 {self.received / elapsed:.0f} msgs/s ({self.samples / elapsed:.0f} samples/s), "
+              f"{n} vehicles, {np.count_nonzero(table.state[:n] != IDLE)} in incident, "
+              f"{np.count_nonzero(table.silent[:n])} silent, "
+              f"tick {1000 * self.tick_time / max(self.ticks, 1):.2f} ms")
+        self.received = self.samples = self.ticks = 0
+        self.tick_time = 0.0
+        self.last_report = now
+
+    def stats(self, vehicle_id):
+        # One vehicle's row as a dict, for inspection
+        row = self.table.rows.get(vehicle_id)
+        if row is None:
+            return None
+        return {name: getattr(self.table, name)[row].item() for name in self.table.columns}
+
+    def stop(self):
+        self.running = False
+
+
+# === MQTT SETUP ===
+def start_mqtt(monitor, broker=BROKER):
+    import paho.mqtt.client as mqtt
+    topic = f"$share/{SHARED_GROUP}/{TOPIC}" if SHARED_GROUP else TOPIC
+
+    def on_connect(client, userdata, flags, rc):
+        client.subscribe(topic)
+        print(f"📡 Subscribed to {topic}")
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = monitor.on_message
+    client.connect_async(broker, 1883, 60)
+    client.loop_start()
+    return client
+
+
+if __name__ == "__main__":
+    zones = None
+    if SPEED_ZONES_FILE:
+        from geofence import GeofenceIndex
+        zones = GeofenceIndex.load(SPEED_ZONES_FILE, default_limit=INCIDENT_SPEED_THRESHOLD)
+    monitor = FleetMonitor(zones=zones)
+    client = start_mqtt(monitor, sys.argv[1] if len(sys.argv) > 1 else BROKER)
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        print("🛑 Fleet subscriber stopped.")
+    finally:
+        monitor.stop()
+        client.loop_stop()
+        client.disconnect()
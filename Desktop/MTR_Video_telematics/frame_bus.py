@@ -0,0 +1,166 @@
+# frame_bus.py
+import multiprocessing
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from capture import CapturedFrame
+
+BUS_MAGIC = 0x56544642                                             # "VTFB"
+BUS_VERSION = 1
+# int64 header: magic, version, slots, height, width, channels, latest_seq
+HEADER_FIELDS = 7
+LATEST = 6
+POLL_INTERVAL = 0.002
+
+
+def attach_shared_memory(name):
+    # Attach to a segment owned by another process. Only the creator may unlink
+    # it, so keep this process's resource tracker from removing it at exit.
+    # Children started by multiprocessing share their parent's tracker, which
+    # already tracks the segment; they must leave the registration alone.
+    shm = shared_memory.SharedMemory(name=name)
+    if multiprocessing.parent_process() is None:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# Fixed ring of frame slots in shared memory, written by one process and read
+# by any number of others. Each slot carries its sequence number and monotonic
+# capture timestamp; a slot's seq is set to -1 while it is being overwritten,
+# so readers can tell a torn frame from a good one.
+class FrameBus:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if self.header[0] != BUS_MAGIC or self.header[1] != BUS_VERSION:
+            raise ValueError(f"{shm.name} is not a version {BUS_VERSION} frame bus")
+        self.slots = int(self.header[2])
+        self.shape = (int(self.header[3]), int(self.header[4]), int(self.header[5]))
+        offset = HEADER_FIELDS * 8
+        self.seqs = np.ndarray((self.slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.slots * 8
+        self.timestamps = np.ndarray((self.slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.slots * 8
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    @classmethod
+    def create(cls, name, slots, shape):
+        height, width, channels = shape
+        size = HEADER_FIELDS * 8 + slots * 16 + slots * height * width * channels
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = (BUS_MAGIC, BUS_VERSION, slots, height, width, channels, 0)
+        del header
+        bus = cls(shm, owner=True)
+        bus.seqs[:] = 0
+        return bus
+
+    @classmethod
+    def attach(cls, name, timeout=0.0):
+        # Waits up to timeout for the publisher to create the bus.
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return cls(attach_shared_memory(name), owner=False)
+            except FileNotFoundError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    # --- writer side ---
+    def publish(self, frame, timestamp, seq=None):
+        seq = int(self.header[LATEST]) + 1 if seq is None else seq
+        index = seq % self.slots
+        self.seqs[index] = -1                                      # slot is being rewritten
+        self.frames[index] = frame
+        self.timestamps[index] = timestamp
+        self.seqs[index] = seq
+        self.header[LATEST] = seq
+        return seq
+
+    # --- reader side ---
+    def latest_seq(self):
+        return int(self.header[LATEST])
+
+    def valid(self, seq):
+        # True while frame `seq` has not been overwritten by the publisher.
+        return self.seqs[seq % self.slots] == seq
+
+    def read_into(self, seq, dst):
+        # Copies frame `seq` into dst; False if that frame was already overwritten.
+        index = seq % self.slots
+        if self.seqs[index] != seq:
+            return False, 0.0
+        timestamp = float(self.timestamps[index])
+        dst[...] = self.frames[index]
+        return self.seqs[index] == seq, timestamp
+
+    def close(self):
+        self.header = self.seqs = self.timestamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass                                                   # a caller still holds a frame view; unmapped at exit
+        if self.owner:
+            self.shm.unlink()
+
+
+# One consumer's cursor on a FrameBus. next() hands out the frame as a view of
+# the shared slot (no pickling, no copy); it stays good until the publisher
+# laps the ring, i.e. for about slots / fps seconds. Consumers that keep a
+# frame longer, or must be sure it was not torn, check valid() after use.
+class FrameBusReader:
+    def __init__(self, bus_name, timeout=5.0, start="live"):
+        self.bus = FrameBus.attach(bus_name, timeout)
+        latest = self.bus.latest_seq()
+        self.next_seq = latest + 1 if start == "live" else max(1, latest - self.bus.slots + 2)
+        self.lagged = 0                                            # frames lost because this reader fell behind
+
+    @property
+    def shape(self):
+        return self.bus.shape
+
+    def next(self, timeout=5.0):
+        # Next CapturedFrame (image is a shared view), or None if nothing arrived in time.
+        deadline = time.monotonic() + timeout
+        while True:
+            latest = self.bus.latest_seq()
+            if latest < self.next_seq:
+                if time.monotonic() > deadline:
+                    return None
+                time.sleep(POLL_INTERVAL)
+                continue
+            if latest - self.next_seq >= self.bus.slots - 1:
+                self.lagged += latest - self.next_seq
+                self.next_seq = latest                             # too far behind: jump to the newest frame
+            seq = self.next_seq
+            self.next_seq += 1
+            index = seq % self.bus.slots
+            timestamp = float(self.bus.timestamps[index])
+            if self.bus.seqs[index] != seq:
+                self.lagged += 1
+                continue
+            return CapturedFrame(seq, timestamp, self.bus.frames[index])
+
+    def latest(self):
+        # Newest published frame without moving the cursor (e.g. for periodic snapshots).
+        seq = self.bus.latest_seq()
+        if seq < 1:
+            return None
+        index = seq % self.bus.slots
+        return CapturedFrame(seq, float(self.bus.timestamps[index]), self.bus.frames[index])
+
+    def valid(self, frame):
+        return self.bus.valid(frame.seq)
+
+    def close(self):
+        self.bus.close()
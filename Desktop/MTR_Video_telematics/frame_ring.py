@@ -0,0 +1,102 @@
+# frame_ring.py
+import time
+
+import numpy as np
+
+
+# Pre-incident frame buffer backed by ONE preallocated (N, H, W, 3) uint8 array.
+# cap.read(image=slot) decodes straight into the next slot, so the capture loop
+# allocates nothing per frame (a deque of cap.read() results allocates ~900 KB
+# per 640x480 frame and keeps the allocator/GC churning).
+class FrameRing:
+    def __init__(self, capacity, resolution, channels=3):
+        self.capacity = int(capacity)
+        width, height = resolution
+        self.frames = np.zeros((self.capacity, height, width, channels), dtype=np.uint8)
+        self.seqs = np.zeros(self.capacity, dtype=np.int64)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)  # monotonic capture time per slot
+        self.head = 0                                              # slot the next frame is written into
+        self.count = 0
+        self.reads = 0                                             # sequence number for frames taken by read()
+
+    def __len__(self):
+        return self.count
+
+    def next_slot(self):
+        return self.frames[self.head]
+
+    def commit(self):
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def read(self, cap):
+        # Drop-in for cap.read(): the returned frame is a view of its ring slot,
+        # valid until the ring wraps around onto it again.
+        slot = self.frames[self.head]
+        ret, frame = cap.read(image=slot)
+        if not ret or frame is None:
+            return False, None
+
+        if not np.shares_memory(frame, slot):
+            # OpenCV reallocated: the camera delivers a different size than requested.
+            if frame.shape != slot.shape:
+                self._reallocate(frame.shape)
+            self.frames[self.head] = frame
+
+        frame = self.frames[self.head]
+        self.seqs[self.head] = self.reads
+        self.timestamps[self.head] = time.monotonic()
+        self.reads += 1
+        self.commit()
+        return True, frame
+
+    def push(self, frame, seq=0, timestamp=0.0):
+        # Copies a frame that was not read through the ring into the next slot.
+        if frame.shape != self.frames.shape[1:]:
+            self._reallocate(frame.shape)
+        slot = self.frames[self.head]
+        slot[...] = frame
+        self.seqs[self.head] = seq
+        self.timestamps[self.head] = timestamp
+        self.commit()
+        return slot
+
+    def latest_timestamp(self):
+        return float(self.timestamps[(self.head - 1) % self.capacity]) if self.count else 0.0
+
+    def snapshot(self):
+        # Ordered (oldest -> newest) list of slot views; no pixel data is copied.
+        # Views stay valid only until the ring overwrites them, so consume them
+        # before capturing another `capacity` frames (or copy what must outlive that).
+        start = (self.head - self.count) % self.capacity
+        return [self.frames[(start + i) % self.capacity] for i in range(self.count)]
+
+    def detach(self, since=None):
+        # Hands the buffered frames (oldest -> newest; with `since`, only those
+        # captured at or after that monotonic time) to another thread without
+        # copying: they are returned as views of the current array, and the ring
+        # carries on in a fresh one. np.zeros only maps pages as they are first
+        # written, so the swap costs nothing up front; the old array is freed
+        # once the writer drops the views. Until then both arrays are resident:
+        # while a clip's pre-roll is being written out, the pre-roll buffer uses
+        # up to twice its size (a spare ring would keep that cost permanently).
+        start = (self.head - self.count) % self.capacity
+        order = (start + np.arange(self.count)) % self.capacity
+        if since is not None:
+            order = order[np.searchsorted(self.timestamps[order], since):]
+        if not len(order):
+            return []
+        frames = self.frames
+        self.frames = np.zeros(frames.shape, dtype=frames.dtype)
+        self.clear()
+        return [frames[i] for i in order]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def _reallocate(self, shape):
+        print(f"⚠️ Camera frame shape {shape} differs from buffer {self.frames.shape[1:]} — reallocating pre-roll buffer.")
+        self.frames = np.zeros((self.capacity,) + tuple(shape), dtype=np.uint8)
+        self.clear()
@@ -0,0 +1,116 @@
+# frame_workers.py
+import datetime
+import multiprocessing
+import os
+import queue
+
+import cv2
+
+from brightness import BrightnessMeter, LOW_LIGHT_THRESHOLD
+from frame_bus import FrameBusReader
+from loop_recorder import SegmentedLoopRecorder
+
+# Worker processes that consume the capture process's FrameBus. Each one reads
+# frames as views of the shared slots, so nothing is pickled or copied across
+# the process boundary and each stage gets its own core and its own GIL.
+# Worker entry points all take (bus_name, stop, *args).
+
+
+def encoder_worker(bus_name, stop, save_dir, fps, segment_seconds, retain_seconds):
+    # Continuous loop recording, moved out of the capture process.
+    reader = FrameBusReader(bus_name)
+    height, width, _ = reader.shape
+    recorder = SegmentedLoopRecorder(save_dir, (width, height), fps, segment_seconds, retain_seconds)
+    try:
+        while not stop.is_set():
+            frame = reader.next(timeout=1.0)
+            if frame is not None:
+                recorder.write(frame.image)
+    finally:
+        recorder.close()
+        print(f"🎞️ Encoder worker stopped (lagged {reader.lagged} frames).")
+        reader.close()
+
+
+def detector_worker(bus_name, stop, events, every=5, threshold=LOW_LIGHT_THRESHOLD):
+    # Low-light check on every `every`-th frame; only state changes are reported.
+    reader = FrameBusReader(bus_name)
+    meter = BrightnessMeter(every=1, threshold=threshold)          # decimation is done on seq below
+    dark = False
+    try:
+        while not stop.is_set():
+            frame = reader.next(timeout=1.0)
+            if frame is None or frame.seq % every:
+                continue
+            brightness = meter.measure(frame.image)
+            if not reader.valid(frame):
+                continue                                           # slot rewritten while we read it
+            if (brightness < threshold) != dark:
+                dark = not dark
+                events.put({"type": "low_light" if dark else "light_restored", "seq": frame.seq,
+                            "timestamp": frame.timestamp, "brightness": brightness})
+    finally:
+        reader.close()
+
+
+def uploader_worker(bus_name, stop, outbox, every_seconds=10.0, keep=30, quality=70):
+    # Stages a JPEG snapshot every few seconds in an outbox directory for the uplink to send.
+    reader = FrameBusReader(bus_name)
+    os.makedirs(outbox, exist_ok=True)
+    staged = []
+    try:
+        while not stop.wait(every_seconds):
+            frame = reader.latest()
+            if frame is None:
+                continue
+            ok, packet = cv2.imencode(".jpg", frame.image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok or not reader.valid(frame):
+                continue
+            stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            path = os.path.join(outbox, f"snapshot_{stamp}.jpg")
+            with open(path + ".part", "wb") as f:
+                f.write(packet.tobytes())
+            os.rename(path + ".part", path)                        # uplink never sees half a file
+            staged.append(path)
+            while len(staged) > keep:
+                try:
+                    os.remove(staged.pop(0))
+                except OSError:
+                    pass                                           # already uploaded and removed
+    finally:
+        reader.close()
+
+
+# Starts and stops the worker processes of one FrameBus. Spawned, not forked,
+# because the capture process is already running threads when they start.
+class FrameWorkers:
+    def __init__(self, bus_name):
+        self.bus_name = bus_name
+        self.ctx = multiprocessing.get_context("spawn")
+        self.stop_event = self.ctx.Event()
+        self.events = self.ctx.Queue()
+        self.processes = []
+
+    def start(self, name, target, *args):
+        process = self.ctx.Process(target=target, args=(self.bus_name, self.stop_event) + args,
+                                   name=name, daemon=True)
+        process.start()
+        self.processes.append(process)
+        return process
+
+    def poll_events(self):
+        # Detector events reported since the last call; never blocks.
+        found = []
+        while True:
+            try:
+                found.append(self.events.get_nowait())
+            except queue.Empty:
+                return found
+
+    def stop(self, timeout=10):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                print(f"⚠️ Worker {process.name} did not stop, terminating.")
+                process.terminate()
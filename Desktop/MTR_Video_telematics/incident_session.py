@@ -0,0 +1,104 @@
+# incident_session.py
+import datetime
+import os
+
+# Gap between a frame's ring timestamp and "after it": keeps a frame out of FrameRing.detach()
+EPSILON = 1e-6
+
+
+# Two-threshold switch for level signals such as brightness: turns on below
+# `enter`, and only turns off again above `exit`, so a value hovering around
+# the threshold does not flap the incident on and off.
+class Hysteresis:
+    def __init__(self, enter, exit, below=True):
+        self.enter = enter
+        self.exit = exit
+        self.below = below                                         # True: low values trigger (darkness)
+        self.active = False
+
+    def update(self, value):
+        if value is None:
+            return self.active
+        if self.below:
+            self.active = value < (self.exit if self.active else self.enter)
+        else:
+            self.active = value > (self.exit if self.active else self.enter)
+        return self.active
+
+
+# One clip per incident *session* instead of one per trigger. Fed every frame
+# after it was pushed into the FrameRing:
+#   idle   -> trigger: open a clip with the pre-roll, stream frames
+#   active -> trigger stops: keep streaming for post_seconds ("post")
+#   post   -> quiet for post_seconds: stop writing, but hold the clip open for
+#             merge_seconds ("merge window")
+#   merge  -> trigger again: the frames skipped meanwhile are appended from the
+#             ring and the same clip continues; window expires: clip closed
+# The pre-roll of a later clip never reaches back before the last frame already
+# written, so every frame is encoded at most once, however often it triggers.
+class IncidentSession:
+    def __init__(self, incident_writer, ring, resolution, fps, pre_seconds=15, post_seconds=15, merge_seconds=10,
+                 save_dir="./incidents", pool_size=None):
+        self.incident_writer = incident_writer
+        self.ring = ring
+        self.resolution = resolution
+        self.fps = fps
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.merge_seconds = min(merge_seconds, pre_seconds)      # the ring must still hold the skipped frames
+        self.save_dir = save_dir
+        self.pool_size = pool_size or int(2 * fps)
+        self.state = "idle"
+        self.clip = None
+        self.last_trigger = None
+        self.last_written = float("-inf")                          # ring timestamp of the newest encoded frame
+        self.sessions = 0
+        self.merged = 0
+
+    def update(self, triggered, frame):
+        timestamp = self.ring.latest_timestamp()
+        if triggered:
+            self.last_trigger = timestamp
+            if self.state == "idle":
+                self._open(timestamp)
+            elif self.state == "merge":
+                backlog = self.ring.detach(self.last_written + EPSILON)     # includes this frame
+                if self.clip:
+                    self.clip.append_block(backlog)
+                self.last_written = timestamp
+                self.merged += 1
+                print(f"🔗 Trigger within {self.merge_seconds}s merge window — extending the current clip.")
+            else:
+                self._append(frame, timestamp)
+            self.state = "active"
+            return
+
+        if self.state in ("active", "post"):
+            self._append(frame, timestamp)
+            self.state = "merge" if timestamp - self.last_trigger >= self.post_seconds else "post"
+        elif self.state == "merge" and timestamp - self.last_trigger >= self.post_seconds + self.merge_seconds:
+            self.close()
+
+    def close(self):
+        if self.clip:
+            self.clip.close()
+        self.clip = None
+        self.state = "idle"
+
+    def _open(self, timestamp):
+        # Pre-roll: the last pre_seconds, but nothing an earlier clip already holds
+        since = max(timestamp - self.pre_seconds, self.last_written + EPSILON)
+        os.makedirs(self.save_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        path = os.path.join(self.save_dir, f"incident_{stamp}.mp4")
+        if os.path.exists(path):                                    # merge window closed within the same second
+            path = os.path.join(self.save_dir, f"incident_{stamp}_{self.sessions + 1}.mp4")
+        self.clip = self.incident_writer.open_clip(path, self.resolution, self.fps,
+                                                   lambda: self.ring.detach(since), pool_size=self.pool_size)
+        self.last_written = timestamp
+        self.sessions += 1
+
+    def _append(self, frame, timestamp):
+        if self.clip:
+            self.clip.append(frame)
+        self.last_written = timestamp
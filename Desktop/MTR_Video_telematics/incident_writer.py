@@ -0,0 +1,170 @@
+# incident_writer.py
+import queue
+import threading
+import time
+
+import numpy as np
+
+from video_writer import open_video_writer
+
+
+# Bounded pool of background threads that persist incident clips, so encoding
+# 800+ frames never runs inside the capture loop. submit() never blocks: when
+# the queue is full the job is rejected (and counted) instead of stalling capture.
+class IncidentWriter:
+    def __init__(self, workers=1, max_pending=2, on_done=None):
+        self.jobs = queue.Queue(maxsize=max_pending)
+        self.on_done = on_done                                     # callback(name, error_or_None, seconds)
+        self.lock = threading.Lock()
+        self.submit_lock = threading.RLock()                       # capacity check and put as one step
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self.threads = []
+        for i in range(workers):
+            t = threading.Thread(target=self._worker, name=f"incident-writer-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, name, fn, *args, **kwargs):
+        with self.submit_lock:
+            try:
+                self.jobs.put_nowait((name, fn, args, kwargs))
+            except queue.Full:
+                self._reject(name)
+                return False
+        self._count("submitted")
+        return True
+
+    def open_clip(self, path, resolution, fps, pre_frames, **kwargs):
+        # Starts a StreamingIncidentClip on a worker; None if the pool is saturated.
+        # pre_frames may be a callable (e.g. ring.detach): it is only called once the
+        # clip has a queue slot, so a rejected clip leaves the pre-roll in the ring.
+        with self.submit_lock:
+            if self.jobs.full():
+                self._reject(path)
+                return None
+            if callable(pre_frames):
+                pre_frames = pre_frames()
+            clip = StreamingIncidentClip(path, resolution, fps, pre_frames, **kwargs)
+            self.submit(path, clip.run)                            # cannot be full: puts are serialized
+        return clip
+
+    def queue_depth(self):
+        return self.jobs.qsize()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+        stats["queued"] = self.jobs.qsize()
+        return stats
+
+    def close(self, timeout=None):
+        # Waits for queued clips to finish, then stops the workers.
+        for _ in self.threads:
+            self.jobs.put((None, None, (), {}))
+        for t in self.threads:
+            t.join(timeout)
+
+    def _worker(self):
+        while True:
+            name, fn, args, kwargs = self.jobs.get()
+            if fn is None:
+                break
+            start = time.monotonic()
+            error = None
+            try:
+                fn(*args, **kwargs)
+                self._count("completed")
+            except Exception as e:
+                error = e
+                self._count("failed")
+                print(f"❌ Failed to save {name}: {e}")
+            if self.on_done:
+                self.on_done(name, error, time.monotonic() - start)
+
+    def _reject(self, name):
+        self._count("rejected")
+        print(f"⚠️ Incident writer busy ({self.jobs.qsize()} queued) — {name} dropped.")
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+
+# Incident clip opened at trigger time. The pre-roll is flushed first, then post
+# frames are streamed to disk as they arrive, through a fixed pool of frame
+# buffers. Memory stays flat however long the incident lasts; if the writer
+# falls behind by more than the pool, frames are dropped (and counted) rather
+# than blocking capture or growing a list. With passthrough=True the "frames"
+# are the camera's MJPEG packets: they are queued as-is and stream-copied.
+class StreamingIncidentClip:
+    def __init__(self, path, resolution, fps, pre_frames, pool_size=40, fourcc="mp4v", passthrough=False):
+        self.path = path
+        self.resolution = resolution
+        self.fps = fps
+        self.fourcc = fourcc
+        self.passthrough = passthrough
+        self.pre_frames = pre_frames
+        width, height = resolution
+        self.free = queue.Queue()
+        for _ in range(pool_size):
+            # packets are already private arrays, so only the slot count is pooled
+            self.free.put(True if passthrough else np.zeros((height, width, 3), dtype=np.uint8))
+        self.pending = queue.Queue()
+        self.written = 0
+        self.dropped = 0
+        self.closed = False
+
+    def append(self, frame):
+        # Called from the capture loop: one memcpy into a pooled buffer, never blocks.
+        if self.closed:
+            return False
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        if self.passthrough:
+            buffer = frame
+        else:
+            if buffer.shape != frame.shape:
+                buffer = np.empty_like(frame)
+            buffer[...] = frame
+        self.pending.put(buffer)
+        return True
+
+    def append_block(self, frames):
+        # Frames the capture path no longer writes to (e.g. FrameRing.detach):
+        # queued as one item, outside the pool, so a backlog is never dropped.
+        if self.closed or not len(frames):
+            return False
+        self.pending.put(list(frames))
+        return True
+
+    def close(self):
+        self.closed = True
+        self.pending.put(None)
+
+    def run(self):
+        # Writer side, executed on an IncidentWriter worker.
+        out = open_video_writer(self.path, self.fps, self.resolution, fourcc=self.fourcc, passthrough=self.passthrough)
+        try:
+            for frame in self.pre_frames:
+                out.write(frame)
+                self.written += 1
+            self.pre_frames = None                                 # pre-roll array can be freed right away
+            while True:
+                buffer = self.pending.get()
+                if buffer is None:
+                    break
+                if isinstance(buffer, list):
+                    for frame in buffer:
+                        out.write(frame)
+                    self.written += len(buffer)
+                    continue
+                out.write(buffer)
+                self.written += 1
+                self.free.put(True if self.passthrough else buffer)
+        finally:
+            out.release()
+        note = f", {self.dropped} dropped" if self.dropped else ""
+        print(f"\n🚨 Incident saved: {self.path} ({self.written} frames{note})\n")
@@ -0,0 +1,148 @@
+# kinematics.py
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+KMH = 1 / 3.6                                                      # km/h -> m/s
+HARSH_BRAKE_MS2 = 4.0                                              # ~0.4 g averaged over ACCEL_SPAN
+CRASH_DECEL_MS2 = 20.0                                             # ~2 g within CRASH_SPAN
+ACCEL_SPAN = 0.5                                                   # seconds each derivative looks back
+CRASH_SPAN = 0.1
+GPS_SPAN = 2.0                                                     # GPS speed/heading need a longer baseline
+MISMATCH_KMH = 15.0                                                # GPS vs speedometer, absolute ...
+MISMATCH_RATIO = 0.3                                               # ... or relative to the reported speed
+MIN_MOVE_M = 5.0                                                   # below this the GPS heading is noise
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great-circle distance in metres; works element-wise on arrays
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    # Initial course from point 1 to point 2 in degrees [0, 360)
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    y = np.sin(lon2 - lon1) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(lon2 - lon1)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def look_back(t, rows, span):
+    # For each row, the index of the newest sample at least `span` seconds older (-1: none)
+    return np.searchsorted(t, t[rows] - span, side="right") - 1
+
+
+def rate(values, t, rows, back):
+    # (values[row] - values[back]) / dt, NaN where there is no sample far enough back
+    j = np.maximum(back, 0)
+    dt = t[rows] - t[j]
+    return np.where((back >= 0) & (dt > 0), (values[rows] - values[j]) / np.maximum(dt, 1e-9), np.nan)
+
+
+def mean_over(values, t, rows, back):
+    # Time-weighted (trapezoidal) mean of values between t[back] and t[row]: what a
+    # straight-line GPS speed over the same span should be compared with
+    cumulative = np.concatenate(([0.0], np.cumsum((values[1:] + values[:-1]) / 2 * np.diff(t))))
+    j = np.maximum(back, 0)
+    dt = t[rows] - t[j]
+    return np.where((back >= 0) & (dt > 0), (cumulative[rows] - cumulative[j]) / np.maximum(dt, 1e-9), np.nan)
+
+
+def gps_course(t, lat, lon, rows):
+    # Straight-line displacement (m), speed (m/s) and course over the last GPS_SPAN;
+    # summing every hop would add up the fix jitter
+    back = look_back(t, rows, GPS_SPAN)
+    j = np.maximum(back, 0)
+    moved = np.where(back >= 0, haversine(lat[j], lon[j], lat[rows], lon[rows]), np.nan)
+    course = np.where(moved >= MIN_MOVE_M, bearing(lat[j], lon[j], lat[rows], lon[rows]), np.nan)
+    return moved / np.maximum(t[rows] - t[j], 1e-9), course, back
+
+
+# Per-vehicle telemetry history: timestamp, lat, lon, speed (km/h) in one
+# preallocated (4, 2 * capacity) array. Every sample is stored twice, at i and
+# i + capacity, so the newest n samples are always ONE contiguous slice and the
+# analysis runs without copying or reordering the ring.
+class KinematicsTrack:
+    def __init__(self, capacity=1024):
+        self.capacity = int(capacity)
+        self.data = np.full((4, 2 * self.capacity), np.nan)
+        self.head = 0                                              # column the next sample goes into
+        self.count = 0
+        self.total = 0                                             # samples ever appended
+        self.analyzed = 0                                          # value of `total` at the last analysis
+        self.next_analysis = float("-inf")
+        self.hold_until = None
+
+    def append(self, timestamp, lat, lon, speed):
+        sample = (timestamp, lat, lon, speed)
+        self.data[:, self.head] = sample
+        self.data[:, self.head + self.capacity] = sample
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.total += 1
+
+    def extend(self, timestamps, lats, lons, speeds):
+        # A block of samples (e.g. one batch message) with two array copies
+        block = np.vstack((timestamps, lats, lons, speeds))[:, -self.capacity:]
+        columns = (self.head + np.arange(block.shape[1])) % self.capacity
+        self.data[:, columns] = block
+        self.data[:, columns + self.capacity] = block
+        self.head = (self.head + block.shape[1]) % self.capacity
+        self.count = min(self.count + block.shape[1], self.capacity)
+        self.total += len(timestamps)
+
+    def window(self, n):
+        # Newest n samples, oldest first, as a (4, n) view
+        end = self.head + self.capacity
+        return self.data[:, end - min(n, self.count):end]
+
+    def analyze(self):
+        # Kinematics of every sample appended since the last call, in one
+        # vectorized pass over just those rows; the older samples each derivative
+        # looks back to are read from the ring in place.
+        new = min(self.total - self.analyzed, self.count)
+        self.analyzed = self.total
+        if new == 0:
+            return None
+        t, lat, lon, speed = self.window(self.count)
+        rows = np.arange(self.count - new, self.count)
+        back = look_back(t, rows, ACCEL_SPAN)
+        accel = rate(speed, t, rows, back) * KMH
+        back_accel = rate(speed, t, back, look_back(t, back, ACCEL_SPAN)) * KMH
+        jerk = (accel - back_accel) / np.maximum(t[rows] - t[np.maximum(back, 0)], 1e-9)
+        crash_accel = rate(speed, t, rows, look_back(t, rows, CRASH_SPAN)) * KMH
+        gps_speed, course, gps_back = gps_course(t, lat, lon, rows)
+        gps_span_speed = mean_over(speed, t, rows, gps_back)
+        heading_change = (course - gps_course(t, lat, lon, np.maximum(gps_back, 0))[1] + 180) % 360 - 180
+
+        return {
+            "accel": accel,                                        # m/s^2
+            "jerk": jerk,                                          # m/s^3
+            "crash_accel": crash_accel,
+            "gps_speed": gps_speed / KMH,                          # km/h
+            "speed": speed[rows],
+            "gps_span_speed": gps_span_speed,                      # km/h, speedometer mean over the GPS span
+            "heading_change": heading_change,                      # degrees over the last GPS_SPAN
+        }
+
+
+def flag_events(metrics, harsh_brake=HARSH_BRAKE_MS2, crash_decel=CRASH_DECEL_MS2,
+                mismatch_kmh=MISMATCH_KMH, mismatch_ratio=MISMATCH_RATIO):
+    # Most severe condition in a block of analyzed samples: (name, detail) or None.
+    # NaNs (not enough history, missing GPS) compare False and never flag.
+    crash = metrics["crash_accel"] < -crash_decel
+    if crash.any():
+        return "crash", (f"Crash deceleration ({metrics['crash_accel'][crash].min():.1f} m/s², "
+                         f"jerk {metrics['jerk'][crash].min():.0f} m/s³)")
+    harsh = metrics["accel"] < -harsh_brake
+    if harsh.any():
+        return "harsh_braking", f"Harsh braking ({metrics['accel'][harsh].min():.1f} m/s²)"
+    # GPS speed is a straight-line average over GPS_SPAN, so it is held against the
+    # speedometer's mean over that span: after a hard stop the last reading is 0
+    speed, gps_speed = metrics["gps_span_speed"], metrics["gps_speed"]
+    mismatch = np.abs(gps_speed - speed) > np.maximum(mismatch_kmh, mismatch_ratio * speed)
+    if mismatch.mean() > 0.5:                                      # sustained, not one bad fix
+        return "gps_mismatch", (f"GPS/speed disagreement (GPS {gps_speed[mismatch].mean():.1f} km/h, "
+                                f"speedometer {speed[mismatch].mean():.1f} km/h)")
+    return None
@@ -0,0 +1,155 @@
+# loop_recorder.py
+import datetime
+import itertools
+import math
+import os
+import queue
+import threading
+from collections import deque
+
+import numpy as np
+
+from video_writer import open_video_writer
+
+
+# Retained loop segments, oldest first. Adding one beyond `keep` deletes the
+# oldest file, so the loop history is simply this list.
+class SegmentHistory:
+    def __init__(self, keep):
+        self.keep = max(1, int(keep))
+        self.paths = deque()
+        self.lock = threading.Lock()
+
+    def add(self, path):
+        with self.lock:
+            self.paths.append(path)
+            while len(self.paths) > self.keep:
+                old = self.paths.popleft()
+                try:
+                    os.remove(old)
+                except OSError as e:
+                    print(f"⚠️ Could not remove old loop segment {old}: {e}")
+
+    def segments(self):
+        with self.lock:
+            return list(self.paths)
+
+
+# Continuous loop recorder writing short fixed-length segments. The capture loop
+# only copies the frame into a pooled buffer (write() never blocks); a writer
+# thread encodes, and a rotator thread keeps the NEXT segment's writer opened in
+# advance and releases finished ones, so a segment switch is a pointer swap.
+# passthrough=True records the camera's MJPEG packets by stream copy.
+class SegmentedLoopRecorder:
+    def __init__(self, save_dir, resolution, fps, segment_seconds=10, retain_seconds=3600,
+                 prefix="loop", fourcc="mp4v", pool_size=None, passthrough=False):
+        self.save_dir = save_dir
+        self.resolution = resolution
+        self.fps = fps
+        self.prefix = prefix
+        self.fourcc = fourcc
+        self.passthrough = passthrough
+        self.frames_per_segment = max(1, int(round(segment_seconds * fps)))
+        self.history = SegmentHistory(math.ceil(retain_seconds / segment_seconds))
+        os.makedirs(save_dir, exist_ok=True)
+
+        width, height = resolution
+        self.free = queue.Queue()
+        for _ in range(pool_size or max(4, int(fps))):
+            self.free.put(True if passthrough else np.zeros((height, width, 3), dtype=np.uint8))
+        self.pending = queue.Queue()
+        self.spares = queue.Queue(maxsize=1)                       # pre-opened (writer, temp path)
+        self.retired = queue.Queue()                               # (writer, temp path, final path)
+        self.spare_ids = itertools.count(1)                        # next() is atomic: writer and rotator both open spares
+        self.dropped = 0
+
+        # Both writers are opened on the background threads: the constructor never
+        # waits for an encoder to start, so capture can begin right away.
+        self.rotator = threading.Thread(target=self._rotate_worker, name="loop-rotator", daemon=True)
+        self.writer = threading.Thread(target=self._write_worker, name="loop-writer", daemon=True)
+        self.rotator.start()
+        self.writer.start()
+
+    # --- capture side ---
+    def write(self, frame):
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        if self.passthrough:
+            buffer = frame
+        else:
+            if buffer.shape != frame.shape:
+                buffer = np.empty_like(frame)
+            buffer[...] = frame
+        self.pending.put(buffer)
+        return True
+
+    def release(self):
+        self.close()
+
+    def close(self):
+        self.pending.put(None)
+        self.writer.join()
+        self.retired.put(None)
+        self.rotator.join()
+        if self.dropped:
+            print(f"⚠️ Loop recorder dropped {self.dropped} frames (writer behind).")
+
+    def segments(self):
+        return self.history.segments()
+
+    # --- background side ---
+    def _open_spare(self):
+        temp_path = os.path.join(self.save_dir, f".{self.prefix}_next_{next(self.spare_ids)}.mp4")
+        writer = open_video_writer(temp_path, self.fps, self.resolution, fourcc=self.fourcc, passthrough=self.passthrough)
+        return writer, temp_path
+
+    def _write_worker(self):
+        writer, temp_path = self._open_spare()
+        final_path = self._final_path()
+        written = 0
+        while True:
+            buffer = self.pending.get()
+            if buffer is None:
+                break
+            if written == self.frames_per_segment:
+                self.retired.put((writer, temp_path, final_path))
+                writer, temp_path = self.spares.get()          # opened ahead of time by the rotator
+                final_path = self._final_path()
+                written = 0
+            writer.write(buffer)
+            written += 1
+            self.free.put(True if self.passthrough else buffer)
+        self.retired.put((writer, temp_path, final_path))
+
+    def _rotate_worker(self):
+        self.spares.put(self._open_spare())
+        while True:
+            item = self.retired.get()
+            if item is None:
+                break
+            writer, temp_path, final_path = item
+            writer.release()
+            try:
+                os.rename(temp_path, final_path)
+                self.history.add(final_path)
+            except OSError as e:
+                print(f"⚠️ Could not finalize loop segment {temp_path}: {e}")
+            if self.spares.empty():
+                self.spares.put(self._open_spare())
+
+        # Shut down: the spare that was opened ahead of time was never written.
+        while not self.spares.empty():
+            writer, temp_path = self.spares.get()
+            getattr(writer, "discard", writer.release)()
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _final_path(self):
+        # Named after the moment its first frame is written (ms resolution, segments are short)
+        stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")[:-3]
+        return os.path.join(self.save_dir, f"{self.prefix}_{stamp}.mp4")
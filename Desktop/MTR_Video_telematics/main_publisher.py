@@ -3,13 +3,29 @@ import time
 import random
 import json
 import paho.mqtt.client as mqtt
+# telemetry_batch / telemetry_codec (and with them numpy) are imported only when BATCH or binary ENCODING needs them
 
 broker = "localhost"
-topic = "vehicle/data"
+VEHICLE_ID = None  # e.g. "bus-17": publish on vehicle/<id>/data for fleet_subscriber.py; None: the shared vehicle/data
+topic = f"vehicle/{VEHICLE_ID}/data" if VEHICLE_ID else "vehicle/data"
+BATCH = False  # True: many samples per message (limits in telemetry_batch.py); needs batch-aware subscribers
+SAMPLE_HZ = 10 if BATCH else 0.5  # CAN/GPS feeds run at 10-100 Hz; unbatched keeps the old one message per 2 s
+ENCODING = "json"  # "binary": struct format of telemetry_codec.py, only for subscribers that decode it
 client = mqtt.Client()
 client.connect(broker, 1883, 60)
 
+def publish_batch(payload):
+    client.publish(topic, payload)
+    print(f"Published batch: {len(payload)} bytes")
+
 def simulate_data():
+    batcher = None
+    if BATCH:
+        from telemetry_batch import TelemetryBatcher
+        batcher = TelemetryBatcher(publish_batch, encoding=ENCODING)
+    encode = json.dumps
+    if ENCODING == "binary":
+        from telemetry_codec import encode_sample as encode
     while True:
         # Normal data
         lat = 12.97 + random.uniform(-0.01, 0.01)
@@ -17,18 +33,22 @@ def simulate_data():
         speed = random.uniform(30, 80)
 
         # Inject random incident
-        if random.random() < 0.05:  # 5% chance
+        if random.random() < 0.025 / SAMPLE_HZ:  # ~2.5% of seconds
             speed = random.uniform(130, 160)  # high-speed incident
 
-        payload = json.dumps({
+        sample = {
+            "timestamp": time.time(),
             "latitude": lat,
             "longitude": lon,
             "speed": speed
-        })
+        }
 
-        client.publish(topic, payload)
-        print("Published:", payload)
-        time.sleep(2)
+        if batcher:
+            batcher.add(sample)
+        else:
+            client.publish(topic, encode(sample))
+            print("Published:", sample)
+        time.sleep(1 / SAMPLE_HZ)
 
 if __name__ == "__main__":
     simulate_data()
@@ -1,101 +1,190 @@
-import cv2
-import os
 import time
-import json
-import paho.mqtt.client as mqtt
-from collections import deque
+MODULE_LOADED = time.monotonic()
+import os
 import datetime
+import shutil
 import threading
+from frame_ring import FrameRing
+from incident_writer import IncidentWriter
+from capture import CaptureThread, open_camera, decode_packet
+from preview import make_preview
+from loop_recorder import SegmentedLoopRecorder, SegmentHistory
+from camera_discovery import find_camera
+from telemetry_batch import newest_sample
+from telemetry_codec import decode, is_binary, read_speed
+from detectors import TriggerBus, DetectorPipeline, SpeedDetector, KinematicsDetector, VIDEO_DETECTOR_TYPES
+# paho and the optional pipelines (packet tap, passthrough buffer, broker, frame
+# bus, multi-camera) are imported where they are used, so a cold start only
+# pays for what this configuration records with.
 
 # === CONFIG ===
 BROKER = "localhost"
 TOPIC = "vehicle/data"
-INCIDENT_SPEED_THRESHOLD = 120  # km/h
+INCIDENT_SPEED_THRESHOLD = 120  # km/h, wherever no speed zone applies
+SPEED_ZONES_FILE = None  # GeoJSON/CSV of per-zone limits (school zones, depots, highways), see geofence.py
 PRE_SECONDS = 20
 POST_SECONDS = 20
 FPS = 20.0
 RESOLUTION = (640, 480)
 SILENCE_TIMEOUT = 30  # seconds without MQTT message
-LOOP_DURATION_MINUTES = 60  # continuous recording duration before overwrite
+LOOP_DURATION_MINUTES = 60  # continuous recording kept before the oldest segments are overwritten
+LOOP_SEGMENT_SECONDS = 10  # length of each continuous recording segment
+USE_PACKET_TAP = shutil.which("ffmpeg") is not None  # cut incidents from the loop stream instead of re-encoding
+CAPTURE_MJPEG = True  # ask the camera for MJPG instead of raw YUYV
+MJPEG_PASSTHROUGH = False  # record the camera's JPEG frames as-is (no encode; bigger files than x264)
+USE_CAMERA_BROKER = False  # read frames from camera_broker.py instead of opening the device here
+USE_FRAME_BUS = False  # publish frames to shared memory; loop encode, detection and upload run as processes
+FRAME_BUS_NAME = "vt_frames"
+FRAME_BUS_SLOTS = 32  # ~1.6 s at 20 fps before a slow worker loses frames
+CAMERAS = []  # e.g. [("front", 0), ("cabin", 2), ("rear", 4)]: record all of them with one MQTT client
+VIDEO_DETECTORS = []  # opt-in video detectors raising incidents next to the speed check, e.g. ["scene_change", "low_light"]
+USE_KINEMATICS = False  # harsh braking / crash / GPS mismatch; needs real 10 Hz+ telemetry (random 1 Hz samples trip it)
 
 # === HELPER ===
 def get_timestamp():
     return datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-def save_incident_clip(pre_frames, post_frames, resolution, fps):
+def incident_path(ext):
     save_dir = "./incidents"
     os.makedirs(save_dir, exist_ok=True)
-    filename = f"incident_{get_timestamp()}.mp4"
-    filepath = os.path.join(save_dir, filename)
+    return os.path.join(save_dir, f"incident_{get_timestamp()}{ext}")
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(filepath, fourcc, fps, resolution)
+def start_incident_clip(tap, pre_buffer, incident_writer, passthrough=False):
+    # Opens the clip at trigger time and flushes the pre-roll right away; post frames
+    # are then streamed to it, so memory stays flat however long the incident lasts.
+    if tap:
+        tap.begin_incident(incident_path(".ts"), incident_writer)
+        return None
+    if passthrough:
+        return incident_writer.open_clip(incident_path(".mp4"), RESOLUTION, FPS, pre_buffer.snapshot(),
+                                         pool_size=int(2 * FPS), passthrough=True)
+    return incident_writer.open_clip(incident_path(".mp4"), RESOLUTION, FPS, pre_buffer.detach,
+                                     pool_size=int(2 * FPS))
 
-    for frame in pre_frames:
-        out.write(frame)
-    for frame in post_frames:
-        out.write(frame)
+def finish_incident_clip(tap, clip, incident_writer):
+    if tap:
+        tap.end_incident()                                      # its writer job remuxes the clip
+    elif clip:
+        clip.close()
 
-    out.release()
-    print(f"\n🚨 Incident saved: {filepath}\n")
+def start_frame_bus(shape, encode_loop):
+    # Bus is sized from the first real frame; workers attach to it by name.
+    from frame_bus import FrameBus
+    from frame_workers import FrameWorkers, encoder_worker, detector_worker, uploader_worker
+    bus = FrameBus.create(FRAME_BUS_NAME, FRAME_BUS_SLOTS, shape)
+    workers = FrameWorkers(FRAME_BUS_NAME)
+    if encode_loop:
+        workers.start("encoder", encoder_worker, "./continuous", FPS, LOOP_SEGMENT_SECONDS,
+                      LOOP_DURATION_MINUTES * 60)
+    workers.start("detector", detector_worker, workers.events)
+    workers.start("uploader", uploader_worker, "./outbox")
+    print(f"🧵 Frame bus '{FRAME_BUS_NAME}' up with {len(workers.processes)} worker processes.")
+    return bus, workers
 
-def save_loop_clip(writer):
-    writer.release()
-    timestamp = get_timestamp()
-    final_path = f"./continuous/loop_{timestamp}.mp4"
-    os.makedirs("./continuous", exist_ok=True)
-    os.rename("./loop_record.mp4", final_path)
-    print(f"💾 Continuous loop saved: {final_path}")
+def seconds_since_start():
+    # Process age from /proc, so interpreter start-up and imports are counted too
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, AttributeError):
+        return time.monotonic() - MODULE_LOADED
+
+def seconds_since_boot():
+    # Boot roughly equals ignition on the vehicle units
+    try:
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+    except AttributeError:
+        return float("nan")
 
 def find_working_camera(max_index=5):
-    for i in range(max_index):
-        cap = cv2.VideoCapture(i)
-        if cap.isOpened():
-            cap.release()
-            print(f"✅ Using camera index: {i}")
-            return i
-        cap.release()
-    print("❌ No working camera found.")
-    return None
+    # sysfs + cached V4L2 capabilities; nothing is opened on a warm start
+    i = find_camera(RESOLUTION, FPS, "MJPG" if CAPTURE_MJPEG else None, max_index=max_index)
+    if i is None:
+        print("❌ No working camera found.")
+        return None
+    print(f"✅ Using camera index: {i}")
+    return i
 
 # === GLOBALS ===
 incident_triggered = False
 incident_clear = False
 last_data = {}
 last_message_time = time.time()
+trigger_bus = TriggerBus()
+detectors = None
+
+# === INCIDENT TRIGGER ===
+def on_trigger(source, active, detail, active_sources):
+    # Every detector ends up here; the incident closes once the last active source clears
+    global incident_triggered, incident_clear
+    if active:
+        if not incident_triggered:
+            print(f"\n🚧 {detail} — incident started...")
+        incident_triggered = True
+        incident_clear = False
+    elif not active_sources and incident_triggered and not incident_clear:
+        print(f"\n✅ {detail} — starting post-incident buffer...")
+        incident_clear = True
+
+def start_detectors():
+    global detectors
+    trigger_bus.subscribe(on_trigger)
+    zones = None
+    if SPEED_ZONES_FILE:
+        from geofence import GeofenceIndex
+        zones = GeofenceIndex.load(SPEED_ZONES_FILE, default_limit=INCIDENT_SPEED_THRESHOLD)
+    telemetry_detectors = [SpeedDetector(INCIDENT_SPEED_THRESHOLD, zones)]
+    if USE_KINEMATICS:
+        telemetry_detectors.append(KinematicsDetector())
+    detectors = DetectorPipeline(trigger_bus,
+                                 video_detectors=[VIDEO_DETECTOR_TYPES[name]() for name in VIDEO_DETECTORS],
+                                 telemetry_detectors=telemetry_detectors)
+    return detectors
 
 # === MQTT CALLBACK ===
 def on_message(client, userdata, msg):
-    global incident_triggered, incident_clear, last_data, last_message_time
+    global last_data, last_message_time
     last_message_time = time.time()
     try:
         if not msg.payload:
             return
-        payload = json.loads(msg.payload.decode())
-        speed = payload.get("speed", 0)
+        if detectors and detectors.speed_only and is_binary(msg.payload):
+            # Only the speed limit is checked: read the speed straight out of the
+            # binary message (last_data keeps the last fully decoded sample)
+            detectors.offer_speed(read_speed(msg.payload))
+            return
+        payload, batch = decode(msg.payload)  # binary or JSON, told apart by the first bytes
+        if batch is not None:
+            # Many samples in one message: detectors see the whole batch at once
+            last_data = newest_sample(batch)
+            if detectors:
+                detectors.offer_batch(batch)
+            return
         last_data = payload
-
-        if speed > INCIDENT_SPEED_THRESHOLD:
-            if not incident_triggered:
-                print(f"\n🚧 High speed detected ({speed:.2f} km/h) — incident started...")
-            incident_triggered = True
-            incident_clear = False
-        else:
-            if incident_triggered and not incident_clear:
-                print(f"\n✅ Speed normalized ({speed:.2f} km/h) — starting post-incident buffer...")
-                incident_clear = True
-    except json.JSONDecodeError:
-        print("⚠️ Invalid JSON payload")
+        if detectors:
+            detectors.offer_message(payload)
+    except ValueError as e:
+        print("⚠️ Invalid telemetry payload:", e)
     except Exception as e:
         print("❌ MQTT error:", e)
 
 # === MQTT SETUP ===
+def on_connect(client, userdata, flags, rc):
+    # (Re)subscribe on every connect; paho's network thread reconnects by itself
+    client.subscribe(TOPIC)
+    print(f"📡 MQTT connected {seconds_since_start():.2f} s after start")
+
 def start_mqtt():
+    # Never blocks capture: connect_async + loop_start retry in the background
+    # until the broker is reachable (it may come up after us at ignition).
+    import paho.mqtt.client as mqtt
     client = mqtt.Client()
+    client.on_connect = on_connect
     client.on_message = on_message
-    client.connect(BROKER, 1883, 60)
-    client.subscribe(TOPIC)
+    client.connect_async(BROKER, 1883, 60)
     client.loop_start()
+    return client
 
 # === SILENCE WATCHDOG ===
 def silence_watchdog():
@@ -106,55 +195,116 @@ def silence_watchdog():
             if incident_triggered:
                 print("\n⚠️ No MQTT messages for 30s — treating as post-incident.")
                 incident_clear = True
+                for detector in detectors.telemetry_detectors if detectors else ():
+                    trigger_bus.forget(detector.name)
 
 # === MAIN CAMERA LOOP ===
 def monitor():
     global incident_triggered, incident_clear
-    CAMERA_INDEX = find_working_camera()
-    if CAMERA_INDEX is None:
-        return
-
-    cap = cv2.VideoCapture(CAMERA_INDEX)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, RESOLUTION[0])
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, RESOLUTION[1])
-    cap.set(cv2.CAP_PROP_FPS, FPS)
+    if USE_CAMERA_BROKER:
+        # Device is shared with the other pipelines through the broker's frame bus
+        from camera_broker import BrokerCapture
+        cap, passthrough = BrokerCapture(fps=FPS, resolution=RESOLUTION), False
+        if not cap.isOpened():
+            return
+    else:
+        CAMERA_INDEX = find_working_camera()
+        if CAMERA_INDEX is None:
+            return
+        cap, passthrough = open_camera(CAMERA_INDEX, RESOLUTION, FPS, mjpeg=CAPTURE_MJPEG,
+                                       passthrough=MJPEG_PASSTHROUGH and shutil.which("ffmpeg") is not None)
+    # Capture starts before the writers are built; its queue holds the first frames meanwhile
+    capture = CaptureThread(cap, RESOLUTION, passthrough=passthrough).start()  # grab/retrieve on its own thread
+    print(f"📷 Camera open {seconds_since_start():.2f} s after start")
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    loop_path = "./loop_record.mp4"
     os.makedirs("./continuous", exist_ok=True)
-    loop_writer = cv2.VideoWriter(loop_path, fourcc, FPS, RESOLUTION)
+    retain_seconds = LOOP_DURATION_MINUTES * 60
+    if passthrough:
+        # Camera JPEGs go straight into loop segments and incident clips; only preview decodes
+        from compressed_buffer import JpegFrameBuffer
+        tap = None
+        loop_writer = SegmentedLoopRecorder("./continuous", RESOLUTION, FPS, LOOP_SEGMENT_SECONDS, retain_seconds,
+                                            passthrough=True)
+        pre_buffer = JpegFrameBuffer(int(PRE_SECONDS * FPS))
+    elif USE_PACKET_TAP:
+        # Single encode; incident clips are cut from the encoded stream by packet copy
+        from packet_tap import EncodedLoopTap
+        loop_path = "./loop_record.ts"
+        tap = EncodedLoopTap(loop_path, RESOLUTION, FPS, PRE_SECONDS)
+        loop_writer = tap
+        loop_history = SegmentHistory(retain_seconds // LOOP_SEGMENT_SECONDS)
+        pre_buffer = None                                       # the pre-roll is the tap's encoded GOPs
+    elif USE_FRAME_BUS:
+        # Loop segments are encoded by the encoder worker process off the frame bus
+        tap = None
+        loop_writer = None
+        pre_buffer = FrameRing(int(PRE_SECONDS * FPS), RESOLUTION)
+    else:
+        # Short segments rotated off the capture thread; the loop history is the retained segment list
+        tap = None
+        loop_writer = SegmentedLoopRecorder("./continuous", RESOLUTION, FPS, LOOP_SEGMENT_SECONDS, retain_seconds)
+        pre_buffer = FrameRing(int(PRE_SECONDS * FPS), RESOLUTION)
     loop_start_time = time.time()
-    max_loop_duration = LOOP_DURATION_MINUTES * 60
 
-    pre_buffer = deque(maxlen=int(PRE_SECONDS * FPS))
-    post_frames = []
+    incident_writer = IncidentWriter(workers=2, max_pending=2)  # clips are saved off the capture thread
+    frame_bus = workers = None
+    incident_open = False
+    clip = None
     post_timer_started = False
     post_timer_start = None
+    first_frame = True
 
+    preview = make_preview("Live Recording")                   # None when headless (PREVIEW=off / no DISPLAY)
     print("🎥 Camera recording started with incident monitoring via MQTT...")
 
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
+            captured = capture.read(timeout=5)
+            if captured is None:
                 print("⚠️ Frame read failed.")
                 break
+            if first_frame:
+                first_frame = False
+                print(f"⏱️ Time to first frame: {seconds_since_start():.2f} s after start, "
+                      f"{seconds_since_boot():.1f} s after boot")
+            if passthrough:
+                frame = captured.image                             # compressed packet, decoded only on demand
+                pre_buffer.append_packet(frame)
+            elif pre_buffer is None:
+                frame = captured.image                             # valid until the next read; everything below copies or writes it
+            else:
+                frame = pre_buffer.push(captured.image, captured.seq, captured.timestamp)
 
-            loop_writer.write(frame)
-            pre_buffer.append(frame)
+            if USE_FRAME_BUS and not passthrough:
+                if frame_bus is None:
+                    frame_bus, workers = start_frame_bus(frame.shape, encode_loop=loop_writer is None)
+                frame_bus.publish(frame, captured.timestamp)
+                for event in workers.poll_events():
+                    trigger_bus.report("low_light_worker", event["type"] == "low_light",
+                                       f"Brightness {event['brightness']:.1f} at frame {event['seq']}")
+            if loop_writer:
+                loop_writer.write(frame)
+            if detectors:
+                detectors.offer_frame(frame, captured.timestamp)  # returns at once unless a detector is due
 
-            if time.time() - loop_start_time >= max_loop_duration:
-                save_loop_clip(loop_writer)
-                loop_writer = cv2.VideoWriter(loop_path, fourcc, FPS, RESOLUTION)
+            if tap and time.time() - loop_start_time >= LOOP_SEGMENT_SECONDS:
+                segment_path = f"./continuous/loop_{get_timestamp()}.ts"
+                tap.rotate(segment_path)                        # switched at the next keyframe by the tap's reader
+                loop_history.add(segment_path)
                 loop_start_time = time.time()
-                print("🔁 Overwriting continuous loop recording...")
 
-            cv2.imshow("Live Recording", frame)
-            if cv2.waitKey(1) & 0xFF == ord('s'):
-                break
+            if preview:
+                if preview.due():
+                    preview.offer(decode_packet(frame, scale=2) if passthrough else frame)
+                if preview.stop_requested:
+                    break
 
             if incident_triggered:
-                post_frames.append(frame)
+                if not incident_open:
+                    clip = start_incident_clip(tap, pre_buffer, incident_writer, passthrough)  # pre-roll ends with this frame
+                    incident_open = True
+                elif clip:
+                    clip.append(frame)
 
                 if incident_clear:
                     if not post_timer_started:
@@ -162,24 +312,81 @@ def monitor():
                         post_timer_started = True
 
                     elif time.time() - post_timer_start >= POST_SECONDS:
-                        print("💾 Saving incident clip...")
-                        save_incident_clip(list(pre_buffer), post_frames, RESOLUTION, FPS)
+                        print("💾 Closing incident clip...")
+                        finish_incident_clip(tap, clip, incident_writer)
+                        print(f"📥 Incident writer: {incident_writer.queue_depth()} pending")
                         incident_triggered = False
                         incident_clear = False
                         post_timer_started = False
-                        post_frames.clear()
+                        incident_open = False
+                        clip = None
 
     except KeyboardInterrupt:
         print("🛑 Interrupted by user.")
 
     finally:
+        capture.stop()
+        print(f"📊 Capture: {capture.stats()}")
         cap.release()
-        save_loop_clip(loop_writer)
-        cv2.destroyAllWindows()
+        if clip:
+            clip.close()
+        if tap:
+            segment_path = tap.release(f"./continuous/loop_{get_timestamp()}.ts")
+            if segment_path and segment_path not in loop_history.segments():
+                loop_history.add(segment_path)                  # counted like any rotated segment
+                print(f"💾 Continuous loop saved: {segment_path}")
+        elif loop_writer:
+            loop_writer.close()
+        if workers:
+            workers.stop()
+            frame_bus.close()
+        incident_writer.close()
+        print(f"📊 Incident writer: {incident_writer.stats()}")
+        if preview:
+            preview.close()
         print("✅ Cleaned up camera and writer.")
 
+# === MULTI-CAMERA LOOP ===
+def monitor_cameras(cameras):
+    # Same MQTT trigger as monitor(), fanned out to every camera as synchronized clips.
+    global incident_triggered, incident_clear
+    from multi_camera import MultiCameraRecorder
+    recorder = MultiCameraRecorder(cameras, RESOLUTION, FPS, PRE_SECONDS, POST_SECONDS,
+                                   segment_seconds=LOOP_SEGMENT_SECONDS,
+                                   retain_seconds=LOOP_DURATION_MINUTES * 60)
+    if not recorder.channels:
+        return
+    recorder.start()
+    clearing = False
+
+    try:
+        while True:
+            time.sleep(0.05)
+            if incident_triggered and (not recorder.incident_active or (clearing and not incident_clear)):
+                recorder.trigger()                              # new incident, or speeding again during the post window
+                clearing = False
+            if incident_triggered and incident_clear and not clearing:
+                recorder.clear()
+                clearing = True
+            if clearing and recorder.incident_done():
+                print("💾 Incident clips closed on all cameras.")
+                incident_triggered = False
+                incident_clear = False
+                clearing = False
+
+    except KeyboardInterrupt:
+        print("🛑 Interrupted by user.")
+
+    finally:
+        recorder.close()
+        print("✅ Cleaned up cameras and writers.")
+
 if __name__ == "__main__":
-    start_mqtt()
+    start_detectors()
+    threading.Thread(target=start_mqtt, name="mqtt-connect", daemon=True).start()  # paho import + connect off the critical path
     threading.Thread(target=silence_watchdog, daemon=True).start()
-    monitor()
+    if CAMERAS:
+        monitor_cameras(CAMERAS)
+    else:
+        monitor()
 
@@ -0,0 +1,171 @@
+# multi_camera.py
+import datetime
+import os
+import threading
+import time
+
+from capture import CaptureThread, open_camera
+from frame_ring import FrameRing
+from incident_writer import IncidentWriter
+from loop_recorder import SegmentedLoopRecorder
+
+# ---------- Config ----------
+CAMERAS = [("front", 0), ("cabin", 2), ("rear", 4)]  # (name, /dev/video index[, fps])
+RESOLUTION = (640, 480)
+FPS = 20.0
+PRE_SECONDS = 20
+POST_SECONDS = 20
+LOOP_SEGMENT_SECONDS = 10
+LOOP_DURATION_MINUTES = 60
+
+
+# One camera of a MultiCameraRecorder. Capture runs on the camera's own
+# CaptureThread and a second thread feeds its pre-roll ring, loop recorder and
+# incident clip, so a slow or stalled camera never holds back the others.
+# Clip start/stop requests are only recorded here and acted on by that thread
+# on its next frame, so the ring is never read while it is being written.
+class CameraChannel:
+    def __init__(self, name, index, resolution, fps, pre_seconds, save_dir, segment_seconds, retain_seconds,
+                 mjpeg=True):
+        self.name = name
+        self.fps = fps
+        self.resolution = resolution
+        self.cap, _ = open_camera(index, resolution, fps, mjpeg=mjpeg)
+        self.opened = self.cap.isOpened()
+        if not self.opened:
+            print(f"❌ Camera '{name}' (index {index}) could not be opened.")
+            return
+        self.capture = CaptureThread(self.cap, resolution, name=f"capture-{name}")
+        self.ring = FrameRing(int(pre_seconds * fps), resolution)
+        self.loop = SegmentedLoopRecorder(save_dir, resolution, fps, segment_seconds, retain_seconds,
+                                          prefix=f"loop_{name}")
+        self.clip = None
+        self.clip_request = None                                   # (incident_writer, path, since)
+        self.clip_end = None                                       # monotonic time the clip stops
+        self.frames = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.closing = False
+        self.thread = threading.Thread(target=self._run, name=f"channel-{name}", daemon=True)
+
+    def start(self):
+        self.capture.start()
+        self.thread.start()
+
+    def request_clip(self, incident_writer, path, since):
+        self.clip_end = None
+        self.clip_request = (incident_writer, path, since)
+
+    def end_clip_at(self, timestamp):
+        self.clip_end = timestamp
+
+    def clip_open(self):
+        return self.clip is not None or self.clip_request is not None
+
+    def stats(self):
+        stats = self.capture.stats()
+        if self.frames > 1:
+            stats["fps"] = round((self.frames - 1) / (self.last_timestamp - self.first_timestamp), 1)
+        return stats
+
+    def close(self):
+        self.closing = True
+        self.capture.stop()
+        self.thread.join(timeout=5)
+        self.cap.release()
+        if self.clip:
+            self.clip.close()
+        self.loop.close()
+
+    def _run(self):
+        while True:
+            item = self.capture.read(timeout=5)
+            if item is None:
+                if not self.closing:
+                    print(f"⚠️ Camera '{self.name}' stopped delivering frames.")
+                break
+            if self.first_timestamp is None:
+                self.first_timestamp = item.timestamp
+            self.last_timestamp = item.timestamp
+            self.frames += 1
+
+            frame = self.ring.push(item.image, item.seq, item.timestamp)
+            self.loop.write(frame)
+
+            if self.clip_request:
+                incident_writer, path, since = self.clip_request
+                self.clip_request = None
+                self.clip = incident_writer.open_clip(path, self.resolution, self.fps,
+                                                      lambda: self.ring.detach(since),
+                                                      pool_size=int(2 * self.fps))
+            elif self.clip:
+                if self.clip_end is not None and item.timestamp >= self.clip_end:
+                    self.clip.close()
+                    self.clip = None
+                    self.clip_end = None
+                else:
+                    self.clip.append(frame)
+
+
+# N cameras in one process behind one trigger. trigger() starts a clip on every
+# camera covering the same pre-roll window, clear() ends them all at the same
+# capture time, so the per-camera files of one incident line up frame-for-frame
+# in wall time. Each camera keeps its own pre-roll ring and loop segments.
+class MultiCameraRecorder:
+    def __init__(self, cameras=CAMERAS, resolution=RESOLUTION, fps=FPS, pre_seconds=PRE_SECONDS,
+                 post_seconds=POST_SECONDS, save_dir="./continuous", incident_dir="./incidents",
+                 segment_seconds=LOOP_SEGMENT_SECONDS, retain_seconds=LOOP_DURATION_MINUTES * 60):
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.incident_dir = incident_dir
+        channels = [CameraChannel(name, index, resolution, rest[0] if rest else fps, pre_seconds, save_dir,
+                                  segment_seconds, retain_seconds) for name, index, *rest in cameras]
+        self.channels = [channel for channel in channels if channel.opened]
+        # One clip per camera can be encoding while the next incident's clips open
+        self.incident_writer = IncidentWriter(workers=max(1, len(self.channels)),
+                                              max_pending=max(2, 2 * len(self.channels)))
+        self.incident_active = False
+
+    def start(self):
+        for channel in self.channels:
+            channel.start()
+        print(f"🎥 Recording {len(self.channels)} cameras: {', '.join(c.name for c in self.channels)}")
+        return self
+
+    def trigger(self):
+        # Opens one synchronized clip per camera; repeated triggers extend the open incident.
+        now = time.monotonic()
+        if self.incident_active:
+            for channel in self.channels:
+                channel.end_clip_at(None)
+            return
+        stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        folder = os.path.join(self.incident_dir, f"incident_{stamp}")
+        os.makedirs(folder, exist_ok=True)
+        for channel in self.channels:
+            channel.request_clip(self.incident_writer, os.path.join(folder, f"{channel.name}.mp4"),
+                                 now - self.pre_seconds)
+        self.incident_active = True
+
+    def clear(self):
+        # All cameras stop at the same capture time, post_seconds from now.
+        end = time.monotonic() + self.post_seconds
+        for channel in self.channels:
+            channel.end_clip_at(end)
+
+    def incident_done(self):
+        # True once every camera closed its clip after clear(); resets for the next incident.
+        if self.incident_active and not any(channel.clip_open() for channel in self.channels):
+            self.incident_active = False
+            return True
+        return False
+
+    def stats(self):
+        return {channel.name: channel.stats() for channel in self.channels}
+
+    def close(self):
+        for channel in self.channels:
+            channel.close()
+        self.incident_writer.close()
+        print(f"📊 Cameras: {self.stats()}")
+        print(f"📊 Incident writer: {self.incident_writer.stats()}")
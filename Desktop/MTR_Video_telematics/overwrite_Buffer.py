@@ -2,6 +2,10 @@ import cv2
 import os
 import time
 from collections import deque
+from preview import make_preview
+from loop_recorder import SegmentedLoopRecorder
+from video_writer import open_video_writer
+from brightness import BrightnessMeter, LOW_LIGHT_THRESHOLD
 import datetime
 
 def get_timestamp():
@@ -13,8 +17,7 @@ def save_incident_clip(pre_frames, post_frames, resolution, fps=20.0):
     filename = f"incident_{get_timestamp()}.mp4"
     filepath = os.path.join(save_dir, filename)
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(filepath, fourcc, fps, resolution)
+    out = open_video_writer(filepath, fps, resolution)
 
     for frame in pre_frames:
         out.write(frame)
@@ -28,6 +31,7 @@ def save_incident_clip(pre_frames, post_frames, resolution, fps=20.0):
 def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
     # Settings
     loop_duration_minutes = 5
+    segment_seconds = 10
     incident_buffer_seconds = 15
 
     loop_duration_seconds = loop_duration_minutes * 60
@@ -37,7 +41,6 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
     # Setup
     save_dir = "/home/csg/Video_telematics/continuous"
     os.makedirs(save_dir, exist_ok=True)
-    loop_file_path = os.path.join(save_dir, "loop_record.mp4")
 
     cap = cv2.VideoCapture(camera_index)
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
@@ -48,11 +51,12 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
         print("❌ Could not open camera.")
         return
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    writer = cv2.VideoWriter(loop_file_path, fourcc, fps, resolution)
+    # Loop = last 5 minutes of 10 s segments; old segments are deleted, not truncated away
+    writer = SegmentedLoopRecorder(save_dir, resolution, fps, segment_seconds, loop_duration_seconds)
 
     frame_buffer = deque(maxlen=buffer_size)
-    loop_start_time = time.time()
+    meter = BrightnessMeter()  # subsampled, re-measured every few frames
+    preview = make_preview('Recording (press s to stop)')
 
     print("🎥 Recording started. 3-min loop + 20s incident capture ready...")
 
@@ -69,17 +73,9 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
             # Add to pre-incident buffer
             frame_buffer.append(frame)
 
-            # Check for overwrite after 5 mins
-            if time.time() - loop_start_time >= loop_duration_seconds:
-                writer.release()
-                writer = cv2.VideoWriter(loop_file_path, fourcc, fps, resolution)
-                loop_start_time = time.time()
-                print("🔁 Overwriting 3-minute loop recording...")
-
             # Check for incident (example: low brightness)
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            brightness = gray.mean()
-            if brightness < 50:
+            brightness = meter.update(frame)
+            if brightness < LOW_LIGHT_THRESHOLD:
                 print(f"🌑 Low brightness detected ({brightness:.2f}) — capturing incident...")
 
                 post_frames = []
@@ -90,26 +86,30 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
                         break
                     writer.write(post_frame)
                     post_frames.append(post_frame)
-                    cv2.imshow('Recording (press s to stop)', post_frame)
-                    if cv2.waitKey(1) & 0xFF == ord('s'):
-                        raise KeyboardInterrupt()
+                    if preview:
+                        preview.offer(post_frame)
+                        if preview.stop_requested:
+                            raise KeyboardInterrupt()
 
                 # Save incident clip
                 save_incident_clip(list(frame_buffer), post_frames, resolution, fps)
+                meter.reset()  # the cached reading predates the post capture; re-measure the next frame
 
             # Show preview
-            cv2.imshow('Recording (press s to stop)', frame)
-            if cv2.waitKey(1) & 0xFF == ord('s'):
-                print("🛑 Stopping recording.")
-                break
+            if preview:
+                preview.offer(frame)
+                if preview.stop_requested:
+                    print("🛑 Stopping recording.")
+                    break
 
     except KeyboardInterrupt:
         print("🛑 Manually interrupted.")
 
     finally:
         cap.release()
-        writer.release()
-        cv2.destroyAllWindows()
+        writer.close()
+        if preview:
+            preview.close()
         print("✅ Camera and writer cleaned up.")
 
 if __name__ == "__main__":
@@ -3,17 +3,18 @@ import os
 import time
 from collections import deque
 import datetime
+from camera_discovery import find_camera
+from brightness import BrightnessMeter, LOW_LIGHT_THRESHOLD
+from preview import make_preview
+from video_writer import open_video_writer
 
 def find_working_camera_index(max_index=5):
-    for index in range(max_index):
-        cap = cv2.VideoCapture(index)
-        if cap.isOpened():
-            cap.release()
-            print(f"✅ Using camera index: {index}")
-            return index
-        cap.release()
-    print("❌ No available camera found.")
-    return None
+    index = find_camera(max_index=max_index)
+    if index is None:
+        print("❌ No available camera found.")
+        return None
+    print(f"✅ Using camera index: {index}")
+    return index
 
 def get_timestamp():
     return datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -24,8 +25,7 @@ def save_incident_clip(pre_frames, incident_frames, post_frames, resolution, fps
     filename = f"incident_{get_timestamp()}.mp4"
     filepath = os.path.join(save_dir, filename)
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(filepath, fourcc, fps, resolution)
+    out = open_video_writer(filepath, fps, resolution)
 
     for frame in pre_frames:
         out.write(frame)
@@ -58,10 +58,10 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
         print("❌ Could not open camera.")
         return
 
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    writer = cv2.VideoWriter(loop_file_path, fourcc, fps, resolution)
+    writer = open_video_writer(loop_file_path, fps, resolution)
 
     frame_buffer = deque(maxlen=pre_buffer_size)
+    meter = BrightnessMeter()  # subsampled, re-measured every few frames
     incident_frames = []
     post_frames = []
     loop_start_time = time.time()
@@ -69,6 +69,7 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
     recording_incident = False
     post_recording = False
     post_record_start_time = None
+    preview = make_preview('Recording (press s to stop)')
 
     print("🎥 Recording started. 3-min loop + incident capture ready...")
 
@@ -88,16 +89,15 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
             # Overwrite after 3 minutes
             if time.time() - loop_start_time >= loop_duration_seconds:
                 writer.release()
-                writer = cv2.VideoWriter(loop_file_path, fourcc, fps, resolution)
+                writer = open_video_writer(loop_file_path, fps, resolution)
                 loop_start_time = time.time()
                 print("🔁 Overwriting 3-minute loop recording...")
 
             # Check brightness
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            brightness = gray.mean()
+            brightness = meter.update(frame)
 
             # Check for low brightness (incident)
-            if brightness < 50 and len(frame_buffer) == pre_buffer_size:
+            if brightness < LOW_LIGHT_THRESHOLD and len(frame_buffer) == pre_buffer_size:
                 if not recording_incident:
                     print(f"🌑 Low brightness detected ({brightness:.2f}) — starting incident recording...")
                     recording_incident = True
@@ -127,10 +127,11 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
                 incident_frames.append(frame)
 
             # Show live
-            cv2.imshow('Recording (press s to stop)', frame)
-            if cv2.waitKey(1) & 0xFF == ord('s'):
-                print("🛑 Stopping recording.")
-                break
+            if preview:
+                preview.offer(frame)
+                if preview.stop_requested:
+                    print("🛑 Stopping recording.")
+                    break
 
     except KeyboardInterrupt:
         print("🛑 Manually interrupted.")
@@ -138,7 +139,8 @@ def continuous_with_incident(camera_index=0, resolution=(640, 480), fps=20.0):
     finally:
         cap.release()
         writer.release()
-        cv2.destroyAllWindows()
+        if preview:
+            preview.close()
         print("✅ Camera and writer cleaned up.")
 
 if __name__ == "__main__":
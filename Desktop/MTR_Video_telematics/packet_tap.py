@@ -0,0 +1,243 @@
+# packet_tap.py
+import os
+import queue
+import subprocess
+import threading
+import time
+from collections import deque
+
+from video_writer import FFMPEG_CODEC, encoder_args
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+PAT_PID = 0x0000
+
+
+# Continuous recorder that encodes every frame exactly once (ffmpeg -> MPEG-TS)
+# and taps the encoded stream on its way to the loop file. The tap keeps a ring
+# of GOPs (each starting on a keyframe), so an incident clip is cut by copying
+# packets: no decode, no second encoder, no CPU spike in the capture loop.
+class EncodedLoopTap:
+    def __init__(self, loop_path, resolution, fps, pre_seconds, codec=FFMPEG_CODEC, gop_seconds=1.0, ffmpeg="ffmpeg"):
+        self.loop_path = loop_path
+        self.resolution = resolution
+        self.fps = fps
+        self.pre_seconds = pre_seconds
+        self.ffmpeg = ffmpeg
+
+        self.gops = deque()                                        # [arrival_time, bytearray] oldest first
+        self.header_packets = {}                                   # latest PAT / PMT packet by PID
+        self.pmt_pids = set()
+        self.lock = threading.Lock()
+        self.incident = None                                       # TapIncident being cut, if any
+        self.rotate_to = None
+
+        width, height = resolution
+        # Short GOPs keep the cut granularity fine; no B-frames so packets stay in display order
+        cmd = [
+            ffmpeg, "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0",
+        ] + encoder_args(fps, codec=codec, gop_seconds=gop_seconds) + ["-bf", "0", "-f", "mpegts", "pipe:1"]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.loop_file = open(loop_path, "wb")
+        self.reader = threading.Thread(target=self._read_stream, daemon=True)
+        self.reader.start()
+
+    # --- cv2.VideoWriter compatible side ---
+    def write(self, frame):
+        try:
+            self.proc.stdin.write(frame.data if frame.flags.c_contiguous else frame.tobytes())
+        except (BrokenPipeError, ValueError):
+            print("⚠️ Encoder pipe closed, frame dropped.")
+
+    def release(self, final_path=None):
+        # Stops the encoder and moves what is left of the loop file to final_path,
+        # or to a rotation target still waiting for its keyframe (already in the
+        # caller's history). Returns the saved segment path, or None.
+        if self.proc.stdin and not self.proc.stdin.closed:
+            self.proc.stdin.close()
+        self.proc.wait()
+        self.reader.join()
+        with self.lock:
+            if self.loop_file is not None:
+                self.loop_file.close()
+                self.loop_file = None
+            segment_path = self.rotate_to or final_path
+            self.rotate_to = None
+            if segment_path:
+                try:
+                    os.rename(self.loop_path, segment_path)
+                except OSError as e:
+                    print(f"⚠️ Could not finalize loop segment {segment_path}: {e}")
+                    segment_path = None
+            if self.incident is not None:
+                self._finish_incident()                            # its writer job still writes and remuxes it
+        return segment_path
+
+    # --- loop rotation ---
+    def rotate(self, final_path):
+        # Current loop file is renamed to final_path at the next keyframe, so both
+        # files start on a GOP boundary and no packet is lost in between.
+        with self.lock:
+            self.rotate_to = final_path
+
+    # --- incident cutting ---
+    def begin_incident(self, path, incident_writer):
+        # Hands the closed GOPs covering the last `pre_seconds` to a job on the
+        # incident writer; the open GOP and every later one follow as they complete.
+        # Only references are taken under the lock: the clip is opened, written and
+        # remuxed on the writer thread, so neither capture nor the reader waits on disk.
+        with self.lock:
+            if self.incident is not None:
+                return False
+            closed = list(self.gops)[:-1]
+            cutoff = time.monotonic() - self.pre_seconds
+            first = 0
+            for i, (arrived, _) in enumerate(closed):
+                if arrived <= cutoff:
+                    first = i                                      # GOP that covers the cutoff instant
+            headers = [self.header_packets[pid] for pid in sorted(self.header_packets)]
+            incident = TapIncident(path, headers, [data for _, data in closed[first:]], self.ffmpeg)
+            if not incident_writer.submit(path, incident.run):
+                return False
+            self.incident = incident
+            return True
+
+    def end_incident(self):
+        # Ends the clip and returns its .ts path; its job remuxes it to .mp4 by stream copy.
+        with self.lock:
+            if self.incident is None:
+                return None
+            return self._finish_incident()
+
+    def _finish_incident(self):
+        if self.gops:
+            self.incident.pending.put(bytes(self.gops[-1][1]))     # open GOP (still growing) is the tail
+        self.incident.pending.put(None)
+        path = self.incident.path
+        self.incident = None
+        return path
+
+    # --- stream parsing ---
+    def _read_stream(self):
+        pending = b""
+        while True:
+            chunk = self.proc.stdout.read(TS_PACKET_SIZE * 64)
+            if not chunk:
+                break
+            pending += chunk
+            usable = len(pending) - len(pending) % TS_PACKET_SIZE
+            with self.lock:
+                for offset in range(0, usable, TS_PACKET_SIZE):
+                    self._handle_packet(pending[offset:offset + TS_PACKET_SIZE])
+            pending = pending[usable:]
+
+    def _handle_packet(self, packet):
+        if packet[0] != TS_SYNC_BYTE:
+            return
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        if pid == PAT_PID:
+            self.header_packets[pid] = packet
+            self.pmt_pids.update(parse_pat(packet))
+        elif pid in self.pmt_pids:
+            self.header_packets[pid] = packet
+
+        if is_keyframe_start(packet):
+            self._close_gop()
+            if self.rotate_to:
+                self._rotate_loop_file()
+            self.gops.append([time.monotonic(), bytearray()])
+        if self.loop_file is not None:
+            self.loop_file.write(packet)
+        if self.gops:
+            self.gops[-1][1] += packet
+
+    def _close_gop(self):
+        # A GOP is complete: queue it for an open incident and trim the ring.
+        if self.gops and self.incident is not None:
+            self.incident.pending.put(self.gops[-1][1])            # never appended to again
+        horizon = time.monotonic() - self.pre_seconds
+        while len(self.gops) > 1 and self.gops[1][0] <= horizon:
+            self.gops.popleft()
+
+    def _rotate_loop_file(self):
+        # Runs on the reader thread: an OSError here must not stop it, or ffmpeg's
+        # stdout fills up and write() blocks the capture loop.
+        target, self.rotate_to = self.rotate_to, None
+        if self.loop_file is not None:
+            self.loop_file.close()
+            self.loop_file = None
+        try:
+            os.rename(self.loop_path, target)
+            mode = "wb"
+        except OSError as e:
+            print(f"⚠️ Could not finalize loop segment {target}: {e}")
+            mode = "ab"                                            # keep appending to the current loop file
+        try:
+            self.loop_file = open(self.loop_path, mode)
+        except OSError as e:
+            print(f"⚠️ Could not reopen loop file {self.loop_path}: {e}")
+            return                                                 # retried at the next rotation
+        if mode == "wb":
+            self._write_headers(self.loop_file)
+
+    def _write_headers(self, f):
+        for pid in sorted(self.header_packets):
+            f.write(self.header_packets[pid])
+
+
+# One incident clip cut from the tap, written by an IncidentWriter worker: the
+# stream headers and pre-roll GOPs, then each GOP queued by the reader until
+# end_incident() queues the tail and None.
+class TapIncident:
+    def __init__(self, path, headers, gops, ffmpeg):
+        self.path = path
+        self.headers = headers
+        self.ffmpeg = ffmpeg
+        self.pending = queue.Queue()
+        for data in gops:
+            self.pending.put(data)
+
+    def run(self):
+        with open(self.path, "wb") as f:
+            for packet in self.headers:
+                f.write(packet)
+            while True:
+                data = self.pending.get()
+                if data is None:
+                    break
+                f.write(data)
+        remux(self.ffmpeg, self.path, self.path[:-len(".ts")] + ".mp4")
+
+
+def parse_pat(packet):
+    # PMT PIDs announced in a PAT packet (single-section PAT, as ffmpeg writes it).
+    if not packet[1] & 0x40:
+        return []
+    start = 4
+    if (packet[3] >> 4) & 0x2:
+        start += 1 + packet[4]
+    start += 1 + packet[start]                                     # pointer field
+    section_length = ((packet[start + 1] & 0x0F) << 8) | packet[start + 2]
+    entries_end = start + 3 + section_length - 4                   # minus CRC32
+    pids = []
+    for pos in range(start + 8, min(entries_end, TS_PACKET_SIZE - 3), 4):
+        program = (packet[pos] << 8) | packet[pos + 1]
+        if program != 0:
+            pids.append(((packet[pos + 2] & 0x1F) << 8) | packet[pos + 3])
+    return pids
+
+
+def is_keyframe_start(packet):
+    # Payload-unit start carrying the random_access_indicator = first packet of a keyframe.
+    if not packet[1] & 0x40:
+        return False
+    if not (packet[3] >> 4) & 0x2 or packet[4] == 0:
+        return False
+    return bool(packet[5] & 0x40)
+
+
+def remux(ffmpeg, src, dst):
+    subprocess.run([ffmpeg, "-loglevel", "error", "-y", "-i", src, "-c", "copy", dst], check=True)
+    os.remove(src)
+    print(f"\n🚨 Incident saved: {dst}\n")
@@ -0,0 +1,155 @@
+# preview.py
+import os
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+# "window" = cv2 window on a side thread, "shm" = publish to shared memory for an
+# external viewer (python preview.py), "off" = headless, no GUI calls at all.
+PREVIEW_MODE = os.environ.get("PREVIEW", "window" if os.environ.get("DISPLAY") else "off")
+PREVIEW_FPS = 5
+PREVIEW_SCALE = 0.5
+SHM_NAME = "vt_preview"
+SHM_HEADER = 3                                                     # int64: seq, height, width
+SHM_MAX_BYTES = 1920 * 1080 * 3
+
+
+def make_preview(title, stop_key="s", mode=None):
+    mode = mode or PREVIEW_MODE
+    if mode == "off":
+        return None
+    return LivePreview(title, stop_key=stop_key, mode=mode)
+
+
+# Decimated live preview kept out of the capture loop. offer() is the only call
+# made per frame: it returns immediately unless a preview frame is due, and then
+# only does one downscale into a preallocated buffer. Display happens elsewhere.
+class LivePreview:
+    def __init__(self, title, stop_key="s", mode="window", fps=PREVIEW_FPS, scale=PREVIEW_SCALE):
+        self.title = title
+        self.stop_key = ord(stop_key)
+        self.mode = mode
+        self.interval = 1.0 / fps
+        self.scale = scale
+        self.last_offer = 0.0
+        self.small = None
+        self.seq = 0
+        self.stop_requested = False
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.running = True
+        self.shm = None
+
+        if mode == "shm":
+            self.shm = open_shared_preview(create=True)
+            self.header = np.ndarray((SHM_HEADER,), dtype=np.int64, buffer=self.shm.buf)
+            self.header[:] = 0
+        self.thread = threading.Thread(target=self._run, name="preview", daemon=True)
+        self.thread.start()
+
+    def due(self):
+        # Lets callers skip producing a frame (e.g. decoding MJPEG) when none is wanted.
+        return time.monotonic() - self.last_offer >= self.interval
+
+    def offer(self, frame):
+        now = time.monotonic()
+        if now - self.last_offer < self.interval:
+            return
+        self.last_offer = now
+        height, width = frame.shape[:2]
+        size = (int(width * self.scale), int(height * self.scale))
+        with self.lock:
+            if self.small is None or self.small.shape[1::-1] != size:
+                self.small = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+            cv2.resize(frame, size, dst=self.small, interpolation=cv2.INTER_NEAREST)
+            self.seq += 1
+        self.ready.set()
+
+    def close(self):
+        self.running = False
+        self.ready.set()
+        self.thread.join(timeout=2)
+        if self.shm is not None:
+            self.header = None                                     # release the exported buffer before close()
+            self.shm.close()
+            self.shm.unlink()
+
+    def _run(self):
+        shown = 0
+        while self.running:
+            self.ready.wait()
+            self.ready.clear()
+            if not self.running:
+                break
+            with self.lock:
+                if self.seq == shown:
+                    continue
+                shown = self.seq
+                if self.mode == "shm":
+                    self._publish(self.small)
+                else:
+                    cv2.imshow(self.title, self.small)
+            if self.mode != "shm" and cv2.waitKey(1) & 0xFF == self.stop_key:
+                print(f"🛑 '{chr(self.stop_key)}' pressed in preview.")
+                self.stop_requested = True
+        if self.mode != "shm":
+            cv2.destroyAllWindows()
+
+    def _publish(self, image):
+        height, width = image.shape[:2]
+        pixels = np.ndarray(image.shape, dtype=np.uint8, buffer=self.shm.buf, offset=SHM_HEADER * 8)
+        self.header[0] = -1                                        # writer busy; viewer skips this round
+        pixels[...] = image
+        self.header[1] = height
+        self.header[2] = width
+        self.header[0] = self.seq
+
+
+def open_shared_preview(create=False):
+    if create:
+        try:
+            stale = shared_memory.SharedMemory(name=SHM_NAME)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        return shared_memory.SharedMemory(name=SHM_NAME, create=True, size=SHM_HEADER * 8 + SHM_MAX_BYTES)
+    shm = shared_memory.SharedMemory(name=SHM_NAME)
+    # Only the creator owns the segment; keep the viewer's resource tracker from unlinking it at exit
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# External viewer for PREVIEW=shm: attaches to the recorder's preview segment.
+def view_shared_preview():
+    shm = open_shared_preview()
+    header = np.ndarray((SHM_HEADER,), dtype=np.int64, buffer=shm.buf)
+    pixels = None
+    shown = 0
+    try:
+        while True:
+            seq, height, width = (int(v) for v in header)
+            if seq > 0 and seq != shown:
+                pixels = np.ndarray((height, width, 3), dtype=np.uint8, buffer=shm.buf, offset=SHM_HEADER * 8)
+                image = pixels.copy()
+                if int(header[0]) == seq:                          # not overwritten while copying
+                    cv2.imshow("Preview", image)
+                    shown = seq
+            if cv2.waitKey(int(1000 / PREVIEW_FPS / 2)) & 0xFF == ord('q'):
+                break
+    finally:
+        header = pixels = None
+        shm.close()
+        cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    try:
+        view_shared_preview()
+    except FileNotFoundError:
+        print("❌ No recorder is publishing a preview (start it with PREVIEW=shm).")
+        sys.exit(1)
@@ -0,0 +1,95 @@
+# telemetry_batch.py
+import json
+import time
+
+import numpy as np
+
+BATCH_FIELDS = ("timestamp", "latitude", "longitude", "speed")
+MAX_SAMPLES = 100                                                  # samples per message
+MAX_BYTES = 8192                                                   # encoded size per message
+MAX_DELAY = 0.5                                                    # seconds the oldest sample may wait
+
+
+# Packs telemetry samples into one message instead of one message per sample:
+#   {"batch": {"timestamp": [...], "latitude": [...], "longitude": [...], "speed": [...]}}
+# Columns rather than a list of objects: the keys go over the wire once, and the
+# subscriber turns each field into a NumPy array in one call. A batch is sent as
+# soon as it holds max_samples, would outgrow max_bytes, or its oldest sample has
+# waited max_delay seconds - whichever comes first. encoding="binary" sends the
+# same columns in the struct format of telemetry_codec.py instead of JSON.
+class TelemetryBatcher:
+    def __init__(self, send, max_samples=MAX_SAMPLES, max_bytes=MAX_BYTES, max_delay=MAX_DELAY, vehicle_id=None,
+                 encoding="json"):
+        self.send = send                                           # send(json_text or bytes)
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.vehicle_id = vehicle_id
+        self.binary = encoding == "binary"
+        if self.binary:
+            from telemetry_codec import encode_batch, SAMPLE_BYTES
+            self.encode_batch, self.sample_bytes = encode_batch, SAMPLE_BYTES
+        self.columns = {field: [] for field in BATCH_FIELDS}
+        self.overhead = len(self._encode())                        # keys and brackets of an empty batch
+        self.count = 0
+        self.size = self.overhead                                  # encoded bytes so far (numbers estimated by repr)
+        self.first = None                                          # monotonic time of the oldest pending sample
+        self.batches = 0
+
+    def add(self, sample):
+        now = time.monotonic()
+        if self.first is None:
+            self.first = now
+        sample_size = self.sample_bytes if self.binary else 0
+        for field in BATCH_FIELDS:
+            value = sample.get(field)
+            if value is None and field == "timestamp":
+                value = time.time()
+            self.columns[field].append(value)
+            if not self.binary:
+                sample_size += len(repr(value)) + 2                # number + ", "
+        self.count += 1
+        self.size += sample_size
+        if (self.count >= self.max_samples or self.size + sample_size > self.max_bytes
+                or now - self.first >= self.max_delay):
+            self.flush()
+
+    def flush(self):
+        if not self.count:
+            return None
+        payload = self._encode()
+        self.columns = {field: [] for field in BATCH_FIELDS}
+        self.count = 0
+        self.size = self.overhead
+        self.first = None
+        self.batches += 1
+        self.send(payload)
+        return payload
+
+    def _encode(self):
+        if self.binary:
+            return self.encode_batch(self.columns, self.vehicle_id)
+        message = {"batch": self.columns}
+        if self.vehicle_id is not None:
+            message["vehicle_id"] = self.vehicle_id
+        return json.dumps(message)
+
+
+def unpack_batch(payload):
+    # Columns of a decoded batch message as float arrays (missing values NaN), or
+    # None when the payload is a single-sample message
+    columns = payload.get("batch")
+    if columns is None:
+        return None
+    count = len(columns.get("speed", ()))
+    batch = {field: np.asarray(columns[field], dtype=np.float64) if field in columns else np.full(count, np.nan)
+             for field in BATCH_FIELDS}
+    batch["vehicle_id"] = payload.get("vehicle_id", "")
+    return batch
+
+
+def newest_sample(batch):
+    # Last sample of a batch as an ordinary single-sample payload
+    if not len(batch["speed"]):
+        return {}
+    return {field: float(batch[field][-1]) for field in BATCH_FIELDS}
@@ -0,0 +1,122 @@
+# telemetry_codec.py
+import json
+import struct
+
+import numpy as np
+
+from telemetry_batch import BATCH_FIELDS, unpack_batch
+
+# Binary telemetry, version 1. Little-endian, one message:
+#   header   "VT", version u8, type u8, sample count u16, vehicle id length u8, reserved u8
+#   id       vehicle id, UTF-8 (may be empty)
+#   columns  timestamp f8[n], latitude f8[n], longitude f8[n], speed f4[n]
+# Speed is float32 (~1e-5 km/h resolution), time and position stay float64.
+# A single sample is a batch of one with type SAMPLE. 28 bytes per sample
+# against ~80 for the JSON object, and a batch decodes to its arrays without
+# parsing. JSON always starts with "{", so both encodings share a topic/socket
+# and the subscriber tells them apart by the first two bytes.
+MAGIC = b"VT"
+VERSION = 1
+SAMPLE = 1
+BATCH = 2
+HEADER = struct.Struct("<2sBBHBx")
+SAMPLE_BYTES = 8 + 8 + 8 + 4
+SPEED = struct.Struct("<f")
+ONE_SAMPLE = struct.Struct("<dddf")                                # the columns of a batch of one
+
+
+def is_binary(raw):
+    return raw[:2] == MAGIC
+
+
+def encode_sample(sample, vehicle_id=None):
+    return _encode(SAMPLE, [[sample.get(field)] for field in BATCH_FIELDS], vehicle_id)
+
+
+def encode_batch(columns, vehicle_id=None):
+    # columns: {"timestamp": [...], "latitude": [...], "longitude": [...], "speed": [...]}
+    return _encode(BATCH, [columns[field] for field in BATCH_FIELDS], vehicle_id)
+
+
+def _encode(kind, columns, vehicle_id):
+    vid = (vehicle_id or "").encode()
+    count = len(columns[0])
+    body = [np.asarray(values, dtype=np.float64 if i < 3 else np.float32).tobytes()
+            for i, values in enumerate(columns)]
+    return b"".join([HEADER.pack(MAGIC, VERSION, kind, count, len(vid)), vid] + body)
+
+
+def message_size(raw):
+    # Length of the binary message at the start of `raw`, None while the header is incomplete
+    if len(raw) < HEADER.size:
+        return None
+    _, _, _, count, vid_len = HEADER.unpack_from(raw)
+    return HEADER.size + vid_len + count * SAMPLE_BYTES
+
+
+def split_messages(buffer):
+    # Complete messages at the start of a byte stream (TCP) carrying binary
+    # messages, framed by their header, and newline-terminated JSON lines.
+    # Returns (messages, unconsumed rest).
+    messages = []
+    start = 0
+    while start < len(buffer):
+        if buffer[start:start + 2] == MAGIC:
+            size = message_size(buffer[start:start + HEADER.size])
+            if size is None or len(buffer) - start < size:
+                break
+            messages.append(buffer[start:start + size])
+            start += size
+        else:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = buffer[start:end].strip()
+            if line:
+                messages.append(line)
+            start = end + 1
+    return messages, buffer[start:]
+
+
+def _header(raw):
+    magic, version, kind, count, vid_len = HEADER.unpack_from(raw)
+    if version != VERSION:
+        raise ValueError(f"unsupported telemetry version {version}")
+    return kind, count, HEADER.size + vid_len
+
+
+def read_speed(raw):
+    # Fast path: speed of a single sample (fastest of a batch) straight from the
+    # bytes - no dict, no arrays for the other fields. JSON falls back to a full decode.
+    if not is_binary(raw):
+        payload, batch = decode(raw)
+        return float(batch["speed"].max()) if batch is not None and len(batch["speed"]) else payload.get("speed", 0)
+    kind, count, offset = _header(raw)
+    offset += count * 24
+    if count == 1:
+        return SPEED.unpack_from(raw, offset)[0]
+    return float(np.frombuffer(raw, np.float32, count, offset).max()) if count else 0
+
+
+def decode(raw):
+    # (payload, batch): a single-sample dict or batch columns (see
+    # telemetry_batch.unpack_batch), the other one None. Binary or JSON.
+    if not is_binary(raw):
+        payload = json.loads(raw)
+        batch = unpack_batch(payload)
+        return (None, batch) if batch is not None else (payload, None)
+
+    kind, count, offset = _header(raw)
+    vid = bytes(raw[HEADER.size:offset]).decode()
+    if kind == SAMPLE and count == 1:
+        payload = dict(zip(BATCH_FIELDS, ONE_SAMPLE.unpack_from(raw, offset)))
+        if vid:
+            payload["vehicle_id"] = vid
+        return payload, None
+    columns = {}
+    for field, dtype in zip(BATCH_FIELDS, (np.float64, np.float64, np.float64, np.float32)):
+        columns[field] = np.frombuffer(raw, dtype, count, offset)
+        offset += count * np.dtype(dtype).itemsize
+    columns["speed"] = columns["speed"].astype(np.float64)
+    columns["vehicle_id"] = vid
+    return None, columns
@@ -0,0 +1,112 @@
+# video_writer.py
+import functools
+import os
+import shutil
+import subprocess
+
+import cv2
+
+# "ffmpeg" pipes raw frames to a local ffmpeg/libx264 process (3-5x smaller files
+# than mp4v, multi-threaded encode); "cv2" is the old cv2.VideoWriter path and
+# the automatic fallback when ffmpeg is missing, cannot encode, or fails to start.
+WRITER_BACKEND = os.environ.get("VIDEO_WRITER", "ffmpeg" if shutil.which("ffmpeg") else "cv2")
+FFMPEG_CODEC = "libx264"
+FFMPEG_PRESET = "veryfast"  # ultrafast..veryslow: CPU per frame vs file size
+FFMPEG_CRF = 26  # 0-51, lower = better quality / bigger files
+FFMPEG_THREADS = 2  # encoder threads; leave cores for capture and detection
+GOP_SECONDS = 2.0  # keyframe interval
+
+
+def encoder_args(fps, codec=FFMPEG_CODEC, preset=FFMPEG_PRESET, crf=FFMPEG_CRF, threads=FFMPEG_THREADS,
+                 gop_seconds=GOP_SECONDS):
+    args = ["-c:v", codec, "-threads", str(threads), "-g", str(max(1, int(round(gop_seconds * fps))))]
+    if codec in ("libx264", "libx265"):
+        args += ["-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p"]
+    else:
+        args += ["-q:v", "5"]
+    return args
+
+
+# Same write()/release()/isOpened() surface as cv2.VideoWriter, so callers can swap it in.
+# With input_format="mjpeg" it takes the camera's JPEG packets and stream-copies
+# them into the container: no decode, no encode.
+class FfmpegPipeWriter:
+    def __init__(self, path, fps, resolution, ffmpeg="ffmpeg", input_format="rawvideo", **options):
+        self.path = path
+        width, height = resolution
+        if input_format == "rawvideo":
+            cmd = [
+                ffmpeg, "-y", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0",
+            ] + encoder_args(fps, **options)
+        else:
+            cmd = [
+                ffmpeg, "-y", "-loglevel", "error",
+                "-f", input_format, "-framerate", str(fps), "-i", "pipe:0", "-c:v", "copy",
+            ]
+        if path.endswith((".mp4", ".mov")):
+            cmd += ["-movflags", "+faststart"]
+        cmd.append(path)
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def isOpened(self):
+        return self.proc.poll() is None
+
+    def write(self, frame):
+        try:
+            self.proc.stdin.write(frame.data if frame.flags.c_contiguous else frame.tobytes())
+        except (BrokenPipeError, ValueError):
+            print(f"⚠️ ffmpeg writer for {self.path} closed, frame dropped.")
+
+    def discard(self):
+        # Writer that never got a frame (e.g. a pre-opened spare): stop ffmpeg, keep no file.
+        self.proc.kill()
+        self.proc.wait()
+
+    def release(self):
+        if not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        if self.proc.wait() != 0:
+            print(f"⚠️ ffmpeg exited with code {self.proc.returncode} while writing {self.path}")
+
+
+@functools.lru_cache(maxsize=None)
+def encoder_works(ffmpeg, args):
+    # One tiny test encode per encoder setup and process: ffmpeg starts fine with an
+    # encoder or pixel format this build lacks and only exits once the first frame
+    # arrives, which would turn every later write into a dropped frame.
+    cmd = [
+        ffmpeg, "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", "64x64", "-i", "pipe:0",
+    ] + list(args) + ["-f", "null", "-"]
+    try:
+        result = subprocess.run(cmd, input=bytes(64 * 64 * 3), stderr=subprocess.PIPE, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"⚠️ ffmpeg encoder check failed ({e}).")
+        return False
+    if result.returncode != 0:
+        print(f"⚠️ ffmpeg cannot encode with {' '.join(args)}: {result.stderr.decode(errors='replace').strip()}")
+    return result.returncode == 0
+
+
+def open_video_writer(path, fps, resolution, backend=None, fourcc="mp4v", passthrough=False, **options):
+    # Factory used by incident clips and loop writers; options go to encoder_args().
+    # passthrough=True writes already-compressed MJPEG packets (needs ffmpeg, no cv2 fallback).
+    if passthrough:
+        return FfmpegPipeWriter(path, fps, resolution, input_format="mjpeg")
+    backend = backend or WRITER_BACKEND
+    if backend == "ffmpeg":
+        ffmpeg = options.pop("ffmpeg", "ffmpeg")
+        if encoder_works(ffmpeg, tuple(encoder_args(fps, **options))):
+            try:
+                writer = FfmpegPipeWriter(path, fps, resolution, ffmpeg=ffmpeg, **options)
+            except OSError as e:
+                print(f"⚠️ ffmpeg writer unavailable ({e}), falling back to cv2.")
+            else:
+                if writer.isOpened():
+                    return writer
+                print(f"⚠️ ffmpeg exited with code {writer.proc.returncode} on start, falling back to cv2.")
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, resolution)